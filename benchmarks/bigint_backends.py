@@ -0,0 +1,55 @@
+import sys
+import os
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from shared import encryption
+
+# Times key generation and decryption on every installed big-integer backend of
+# shared/encryption.py and reports the speedup over the pure-Python backend.
+# tests/test_bigint_backends.py checks that the backends agree.
+
+KEYGEN_RUNS = 5
+DECRYPT_ROUNDS = 50
+SIZES = (1024, 2048, 3072)
+
+def time_keygen(bits):
+    samples = []
+    for _ in range(KEYGEN_RUNS):
+        start = time.perf_counter()
+        encryption.generate_keys(bits)
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)[len(samples) // 2]
+
+
+def time_decrypt(ciphertext, private_key):
+    start = time.perf_counter()
+    for _ in range(DECRYPT_ROUNDS):
+        encryption.decrypt_oaep(ciphertext, private_key)
+    return (time.perf_counter() - start) / DECRYPT_ROUNDS
+
+
+def main():
+    backends = encryption.available_backends()
+    if "gmpy2" not in backends:
+        print("⚠️ gmpy2 is not installed: only the python backend is timed (pip install gmpy2)\n")
+
+    print(f"=== Key generation (median of {KEYGEN_RUNS}) and OAEP decrypt ===\n")
+    for bits in SIZES:
+        encryption.set_backend("python")
+        public_key, private_key = encryption.generate_keys(bits)
+        ciphertext = encryption.encrypt_oaep(os.urandom(16), public_key)
+
+        baseline = None
+        for name in backends:
+            encryption.set_backend(name)
+            keygen = time_keygen(bits)
+            decrypt = time_decrypt(ciphertext, private_key)
+            if baseline is None:
+                baseline = keygen, decrypt
+            print(f"{bits:>5} bits  {name:<7} keygen {keygen * 1000:9.1f} ms ({baseline[0] / keygen:5.2f}x)  "
+                  f"decrypt {decrypt * 1000:7.3f} ms ({baseline[1] / decrypt:5.2f}x)")
+        print()
+
+if __name__ == "__main__":
+    main()
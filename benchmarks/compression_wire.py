@@ -0,0 +1,64 @@
+import sys
+import os
+import random
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "client")))
+
+from shared import compression, envelope
+from websocekt_client import pack_batch
+
+# Bytes on the wire for the same chat traffic under each set of formats a room can
+# be granted, counted the way WebSocketClient does (compression.count / summary).
+# A frame on the wire is a flags byte, a 16-byte IV and the PKCS7-padded AES-CBC ciphertext.
+# bin1 envelopes also carry each message's timestamp and sequence number, which JSON
+# ones don't; compressed, those bytes are most of the difference between the two.
+
+MESSAGES = 2000
+BATCH = 8  # messages per frame when batching, e.g. a paste or a bot
+USERS = ["ahmed", "mohammed", "fawzy", "someone_with_a_long_name"]
+WORDS = ("the you and that for are with this have what just not was but can hello thanks "
+         "okay yes no lol see later good morning night meeting file send coming").split()
+
+
+def corpus(seed=0):
+    rng = random.Random(seed)
+    return [(rng.choice(USERS), " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 30))))
+            for _ in range(MESSAGES)]
+
+
+def wire_size(payload):
+    return 1 + 16 + (len(payload) // 16 + 1) * 16
+
+
+def run(messages, compress, binary, batching):
+    stats = compression.new_stats()
+    size = BATCH if batching else 1
+    for i in range(0, len(messages), size):
+        encoded = [envelope.encode(username, msg, seq=i + 1) if binary else envelope.encode_json(username, msg)
+                   for username, msg in messages[i:i + size]]
+        plaintext = pack_batch(encoded)
+        if compress:
+            payload = compression.compress(plaintext, stats)
+        else:
+            payload = plaintext
+            compression.count(stats, plaintext, payload)
+        stats["wire_bytes"] += wire_size(payload)
+    return stats
+
+
+def main():
+    messages = corpus()
+    print(f"=== Wire bytes for {MESSAGES} chat messages by granted formats ===\n")
+    baseline = None
+    for binary in (False, True):
+        for batching in (False, True):
+            for compress in (False, True):
+                stats = run(messages, compress, binary, batching)
+                baseline = baseline or stats["wire_bytes"]
+                formats = [name for name, on in (("bin1", binary), (f"batch x{BATCH}", batching),
+                                                 (compression.ALGORITHM, compress)) if on] or ["json only"]
+                print(f"{' + '.join(formats):<36} {stats['wire_bytes'] / baseline:6.1%} of json only")
+                print(f"    {compression.summary(stats)}")
+
+if __name__ == "__main__":
+    main()
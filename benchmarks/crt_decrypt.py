@@ -0,0 +1,29 @@
+import sys
+import os
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from shared import encryption
+
+ROUNDS = 20
+
+def time_decrypt(ciphertext, private_key):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        encryption.decrypt_oaep(ciphertext, private_key)
+    return (time.perf_counter() - start) / ROUNDS
+
+def main():
+    print("=== RSA-OAEP decrypt: (d, n) vs CRT ===\n")
+    for bits in (1024, 2048, 3072, 4096):
+        public_key, private_key = encryption.generate_keys(bits)
+        legacy_key = (private_key.d, private_key.n)
+        ciphertext = encryption.encrypt_oaep(os.urandom(16), public_key)
+
+        legacy = time_decrypt(ciphertext, legacy_key)
+        crt = time_decrypt(ciphertext, private_key)
+        print(f"{bits:>5} bits  legacy {legacy * 1000:8.2f} ms  "
+              f"crt {crt * 1000:8.2f} ms  speedup {legacy / crt:5.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import sys
+import os
+import json
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from shared import envelope
+
+ROUNDS = 50000
+
+MESSAGES = [
+    ("ahmed", "ok"),
+    ("mohammed", "are you coming to the meeting later?"),
+    ("fawzy", "لا مشكلة، سأرسل الملف بعد قليل"),
+    ("someone_with_a_long_name", "lorem ipsum dolor sit amet " * 20),
+]
+
+def per_op(fn, *args):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(*args)
+    return (time.perf_counter() - start) / ROUNDS
+
+def json_decode(data):
+    return json.loads(data)
+
+def main():
+    print("=== Chat envelope: JSON vs binary (per message, before compression/AES) ===\n")
+    print(f"{'message':>8} {'json B':>7} {'bin B':>6} {'json enc':>9} {'bin enc':>8} {'json dec':>9} {'bin dec':>8}")
+    for username, msg in MESSAGES:
+        as_json = envelope.encode_json(username, msg)
+        as_binary = envelope.encode(username, msg, seq=1)
+        json_enc = per_op(envelope.encode_json, username, msg)
+        bin_enc = per_op(envelope.encode, username, msg, None, 1)
+        json_dec = per_op(json_decode, as_json)
+        bin_dec = per_op(envelope.decode, as_binary)
+        print(f"{len(msg):>6}ch {len(as_json):>7} {len(as_binary):>6} "
+              f"{json_enc * 1e6:>7.2f}us {bin_enc * 1e6:>6.2f}us {json_dec * 1e6:>7.2f}us {bin_dec * 1e6:>6.2f}us")
+    print("\nThe binary envelope also carries a timestamp and sequence number the JSON one lacks.")
+
+if __name__ == "__main__":
+    main()
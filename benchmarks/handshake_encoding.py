@@ -0,0 +1,47 @@
+import sys
+import os
+import json
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from shared import handshake_codec
+
+ROUNDS = 2000
+OPTIONS = {"room": "general", "seq": True, "since": 0,
+           "compression": ["zlib-dict-v2"], "envelope": ["bin1"]}
+
+def per_op(fn, *args):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(*args)
+    return (time.perf_counter() - start) / ROUNDS
+
+def main():
+    print("=== Handshake hello + reply: JSON decimal vs binary big-endian ===\n")
+    print(f"{'bits':>5} {'json B':>7} {'bin B':>6} {'json parse':>11} {'bin parse':>10}")
+    for bits in (1024, 2048, 3072, 4096):
+        # Random odd modulus/ciphertext of the right size; only the encoding is measured
+        n = int.from_bytes(os.urandom(bits // 8), "big") | (1 << (bits - 1)) | 1
+        c = int.from_bytes(os.urandom(bits // 8), "big") % n
+        public_key = (65537, n)
+
+        json_hello = json.dumps({"type": "ISC", "key": public_key, **OPTIONS})
+        json_reply = json.dumps({"type": "ISC", "key": c, "room": "general"})
+        bin_hello = handshake_codec.pack_hello(public_key, OPTIONS)
+        bin_reply = handshake_codec.pack_reply(c, n, {"room": "general"})
+
+        def parse_json():
+            json.loads(json_hello)
+            json.loads(json_reply)
+
+        def parse_binary():
+            handshake_codec.unpack_hello(bin_hello)
+            handshake_codec.unpack_reply(bin_reply)
+
+        json_size = len(json_hello) + len(json_reply)
+        bin_size = len(bin_hello) + len(bin_reply)
+        print(f"{bits:>5} {json_size:>7} {bin_size:>6} {per_op(parse_json) * 1e6:>9.1f}us "
+              f"{per_op(parse_binary) * 1e6:>8.1f}us")
+
+if __name__ == "__main__":
+    main()
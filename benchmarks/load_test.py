@@ -0,0 +1,315 @@
+import sys
+import os
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import random
+import subprocess
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import websockets
+from shared import encryption, envelope, framing, handshake_codec
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+# Headless load generator for server.py: many simulated clients spread over several
+# processes, each doing the real RSA handshake and AES-CBC encryption of the chat
+# client. Every message carries its send time (wall clock, shared by all processes
+# on this host), so receivers can measure end-to-end fan-out latency.
+#
+#   python load_test.py --clients 1000 --processes 8 --rooms 10 --spawn --output run.json
+#   python load_test.py ... --compare run.json
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CONNECT_CONCURRENCY = 50  # handshakes in flight per process
+BUCKETS_PER_OCTAVE = 8    # latency histogram resolution, about 9% per bucket
+
+
+def aes_encrypt(plaintext, key):
+    iv = os.urandom(16)
+    padder = padding.PKCS7(128).padder()
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    return iv + encryptor.update(padder.update(plaintext) + padder.finalize()) + encryptor.finalize()
+
+
+def aes_decrypt(data, key):
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(data[:16])).decryptor()
+    unpadder = padding.PKCS7(128).unpadder()
+    return unpadder.update(decryptor.update(data[16:]) + decryptor.finalize()) + unpadder.finalize()
+
+
+def bucket(latency_us):
+    return int(math.log2(max(latency_us, 1)) * BUCKETS_PER_OCTAVE)
+
+
+def bucket_upper(index):
+    return 2 ** ((index + 1) / BUCKETS_PER_OCTAVE)
+
+
+def histogram_percentile(histogram, total, q):
+    """Upper bound (us) of the bucket holding the q-th fraction of samples"""
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for index in sorted(histogram):
+        seen += histogram[index]
+        if seen >= target:
+            return bucket_upper(index)
+    return bucket_upper(max(histogram))
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+class SimulatedClient:
+    def __init__(self, name, room, keypair):
+        self.name = name
+        self.room = room
+        self.public_key, self.private_key = keypair
+        self.websocket = None
+        self.key = None
+        self.sent = 0
+        self.lag = 0.0      # total seconds sends went out behind schedule
+        self.lag_max = 0.0
+
+    async def connect(self, url):
+        """Open the socket and run the binary handshake; returns the handshake time in seconds"""
+        start = time.perf_counter()
+        self.websocket = await websockets.connect(url, max_queue=None)
+        await self.websocket.send(handshake_codec.pack_hello(
+            self.public_key, {"room": self.room, "seq": True, "envelope": [envelope.FORMAT]}))
+        _, ciphertext, _ = handshake_codec.unpack_reply(await self.websocket.recv())
+        self.key = encryption.decrypt_oaep(ciphertext, self.private_key)
+        return time.perf_counter() - start
+
+    async def send_loop(self, rate, stop_at):
+        interval = 1.0 / rate
+        await asyncio.sleep(random.random() * interval)  # spread clients over the interval
+        next_send = time.perf_counter()
+        while next_send < stop_at:
+            # A generator that can't keep its own schedule measures itself, not the server
+            lag = time.perf_counter() - next_send
+            self.lag += lag
+            self.lag_max = max(self.lag_max, lag)
+            plaintext = envelope.encode(self.name, str(time.time_ns()))
+            await self.websocket.send(aes_encrypt(plaintext, self.key))
+            self.sent += 1
+            next_send += interval
+            await asyncio.sleep(max(next_send - time.perf_counter(), 0))
+
+    async def receive_loop(self, stats, stop_at):
+        try:
+            while True:
+                timeout = stop_at - time.perf_counter()
+                if timeout <= 0:
+                    return
+                frame = await asyncio.wait_for(self.websocket.recv(), timeout)
+                for _, data in framing.unpack(frame):
+                    sent_ns = int(envelope.decode(aes_decrypt(data, self.key))["msg"])
+                    latency_us = (time.time_ns() - sent_ns) / 1000
+                    stats["received"] += 1
+                    stats["max_us"] = max(stats["max_us"], latency_us)
+                    index = bucket(latency_us)
+                    stats["histogram"][index] = stats["histogram"].get(index, 0) + 1
+        except (asyncio.TimeoutError, websockets.ConnectionClosed):
+            pass
+
+
+async def run_process(index, args, rooms, ready, start, results):
+    keypair = encryption.generate_keys(args.key_size)
+    clients = [SimulatedClient(f"load-{index}-{i}", rooms[i % len(rooms)], keypair)
+               for i in range(index, args.clients, args.processes)]
+
+    slots = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect(client):
+        async with slots:
+            return await client.connect(args.url)
+
+    stats = {"received": 0, "max_us": 0.0, "histogram": {}, "errors": 0}
+    handshakes = []
+    for outcome in await asyncio.gather(*[connect(c) for c in clients], return_exceptions=True):
+        if isinstance(outcome, BaseException):
+            stats["errors"] += 1
+        else:
+            handshakes.append(outcome)
+    connected = [c for c in clients if c.key is not None]
+
+    ready.put(index)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, start.wait)
+
+    stop_sending = time.perf_counter() + args.duration
+    stop_receiving = stop_sending + args.drain
+    tasks = [asyncio.create_task(c.receive_loop(stats, stop_receiving)) for c in connected]
+    tasks += [asyncio.create_task(c.send_loop(args.rate, stop_sending)) for c in connected]
+    await asyncio.gather(*tasks)
+
+    for client in connected:
+        await client.websocket.close()
+    results.put({
+        "clients": len(connected),
+        "sent": sum(c.sent for c in connected),
+        "lag": sum(c.lag for c in connected),
+        "lag_max": max((c.lag_max for c in connected), default=0.0),
+        "handshakes": handshakes,
+        **stats,
+    })
+
+
+def process_main(index, args, rooms, ready, start, results):
+    asyncio.run(run_process(index, args, rooms, ready, start, results))
+
+
+def cpu_seconds(pid):
+    """User + system CPU of pid and its direct children (server workers), from /proc; None elsewhere"""
+    if pid is None or not os.path.isdir("/proc"):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    total = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # fields[1] is the parent pid, fields[11] and fields[12] utime and stime
+        if int(entry) == pid or int(fields[1]) == pid:
+            total += int(fields[11]) + int(fields[12])
+    return total / ticks
+
+
+def spawn_server(args):
+    port = args.url.rsplit(":", 1)[1].split("/")[0]
+    server = subprocess.Popen([sys.executable, "server.py", "--workers", str(args.workers), "--port", port],
+                              cwd=ROOT, stdout=subprocess.DEVNULL)
+    time.sleep(1.5 + 0.5 * args.workers)
+    return server
+
+
+def run(args):
+    server = spawn_server(args) if args.spawn else None
+    server_pid = server.pid if server else args.server_pid
+    # A fresh set of rooms per run, so no backlog from earlier runs is replayed
+    run_id = os.urandom(3).hex()
+    rooms = [f"load-{run_id}-{i}" for i in range(args.rooms)]
+
+    ctx = multiprocessing.get_context("spawn")
+    ready, results, start = ctx.Queue(), ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=process_main, args=(i, args, rooms, ready, start, results), daemon=True)
+             for i in range(args.processes)]
+    try:
+        for proc in procs:
+            proc.start()
+        for _ in procs:
+            ready.get()
+
+        cpu_before = cpu_seconds(server_pid)
+        began = time.perf_counter()
+        start.set()
+        parts = [results.get() for _ in procs]
+        wall = time.perf_counter() - began
+        cpu_after = cpu_seconds(server_pid)
+        for proc in procs:
+            proc.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    histogram = {}
+    for part in parts:
+        for index, count in part["histogram"].items():
+            histogram[index] = histogram.get(index, 0) + count
+    received = sum(part["received"] for part in parts)
+    sent = sum(part["sent"] for part in parts)
+    clients = sum(part["clients"] for part in parts)
+    handshakes = [h for part in parts for h in part["handshakes"]]
+    max_us = max((part["max_us"] for part in parts), default=0)
+    members = clients / args.rooms
+    expected = sent * (members - 1)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    return {
+        "suite": "server-load",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": config,
+        "clients_connected": clients,
+        "connect_errors": sum(part["errors"] for part in parts),
+        "handshake_p50_ms": (percentile(handshakes, 0.50) or 0) * 1e3,
+        "handshake_p95_ms": (percentile(handshakes, 0.95) or 0) * 1e3,
+        "sent": sent,
+        "received": received,
+        "delivery_ratio": received / expected if expected else None,
+        "sent_per_sec": sent / args.duration,
+        "delivered_per_sec": received / wall,
+        "latency_p50_ms": min(histogram_percentile(histogram, received, 0.50) or 0, max_us) / 1e3,
+        "latency_p90_ms": min(histogram_percentile(histogram, received, 0.90) or 0, max_us) / 1e3,
+        "latency_p99_ms": min(histogram_percentile(histogram, received, 0.99) or 0, max_us) / 1e3,
+        "latency_max_ms": max_us / 1e3,
+        "send_lag_mean_ms": 1e3 * sum(part["lag"] for part in parts) / sent if sent else 0.0,
+        "send_lag_max_ms": 1e3 * max(part["lag_max"] for part in parts),
+        "server_cpu_percent": (100 * (cpu_after - cpu_before) / wall
+                               if cpu_before is not None and cpu_after is not None else None),
+    }
+
+
+SUMMARY = ("clients_connected", "handshake_p50_ms", "handshake_p95_ms", "delivery_ratio", "sent_per_sec",
+           "delivered_per_sec", "latency_p50_ms", "latency_p90_ms", "latency_p99_ms", "latency_max_ms",
+           "send_lag_mean_ms", "server_cpu_percent")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated-client load test for server.py")
+    parser.add_argument("--url", default="ws://127.0.0.1:6790")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=max(os.cpu_count() // 2, 1))
+    parser.add_argument("--rooms", type=int, default=1, help="clients are spread evenly over this many rooms")
+    parser.add_argument("--rate", type=float, default=1.0, help="messages per second per client")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of sending")
+    parser.add_argument("--drain", type=float, default=3.0, help="seconds to keep receiving after sending stops")
+    parser.add_argument("--key-size", type=int, default=2048)
+    parser.add_argument("--spawn", action="store_true", help="start a local server.py for the run")
+    parser.add_argument("--workers", type=int, default=1, help="server workers when spawning")
+    parser.add_argument("--server-pid", type=int, help="pid of an already running server, for CPU usage")
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument("--compare", help="JSON results of an earlier run to print side by side")
+    args = parser.parse_args()
+    args.processes = min(args.processes, args.clients)
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print(f"=== {results['clients_connected']} clients, {args.rooms} room(s), "
+          f"{args.rate:g} msg/s each for {args.duration:g} s ===\n")
+    for key in SUMMARY:
+        value = results[key]
+        line = f"{key:>20}  {value:12.2f}" if value is not None else f"{key:>20}  {'n/a':>12}"
+        if baseline is not None and baseline.get(key) is not None and value is not None:
+            line += f"   was {baseline[key]:12.2f}"
+        print(line)
+
+    if results["send_lag_mean_ms"] > 100 / args.rate:
+        print("\n⚠️ Sends ran behind schedule: the load generator is saturated, "
+              "latencies include its own queueing. Use more processes or another host.")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
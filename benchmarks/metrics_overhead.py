@@ -0,0 +1,75 @@
+import sys
+import os
+import asyncio
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import server
+
+ROOM = "bench"
+ENQUEUES = 200000  # per trial: fewer frames for bigger rooms
+TRIALS = 7
+FRAME = os.urandom(120)
+
+
+class NullWebSocket:
+    async def send(self, frame):
+        pass
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def time_deliveries(clients):
+    """Seconds per deliver() to the room, with metrics off and on
+
+    Off and on runs alternate and the best of TRIALS is kept for each, so drift
+    on the machine doesn't land on one side only.
+    """
+    messages = max(ENQUEUES // len(clients), 100)
+    best = {False: None, True: None}
+    for _ in range(TRIALS):
+        for enabled in (False, True):
+            server.METRICS_ENABLED = enabled
+            start = time.perf_counter()
+            for seq in range(messages):
+                server.deliver(ROOM, seq, FRAME, 0)
+            elapsed = (time.perf_counter() - start) / messages
+            if best[enabled] is None or elapsed < best[enabled]:
+                best[enabled] = elapsed
+            for client in clients:
+                client.queue = asyncio.Queue()  # drop what piled up; no writer is draining
+    server.METRICS_ENABLED = True
+    return best[False], best[True]
+
+
+async def run(members):
+    server.OUTBOUND_QUEUE_SIZE = 0  # unbounded, so drops don't skew the timing
+    clients = []
+    for _ in range(members):
+        client = server.ClientConnection(NullWebSocket(), ROOM, sequenced=True)
+        client.writer.cancel()
+        server.join_room(client)
+        clients.append(client)
+
+    off, on = time_deliveries(clients)
+
+    start = time.perf_counter()
+    body = server.registry.render()
+    scrape = time.perf_counter() - start
+
+    for client in clients:
+        server.leave_room(client)
+    server.room_history.clear()
+    return off, on, scrape, len(body)
+
+
+def main():
+    print("=== Metrics overhead on broadcast fan-out (deliver() per frame) ===\n")
+    for members in (1, 10, 100, 1000):
+        off, on, scrape, size = asyncio.run(run(members))
+        print(f"{members:>5} members  off {off * 1e6:8.2f} us  on {on * 1e6:8.2f} us  "
+              f"overhead {(on - off) / off * 100:5.1f}%  scrape {scrape * 1e3:6.2f} ms ({size} bytes)")
+
+if __name__ == "__main__":
+    main()
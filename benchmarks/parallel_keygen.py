@@ -0,0 +1,26 @@
+import sys
+import os
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from shared import encryption
+
+ROUNDS = 3
+
+def time_keygen(bits, parallel, workers=None):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        encryption.generate_keys(bits, parallel=parallel, workers=workers)
+    return (time.perf_counter() - start) / ROUNDS
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    print(f"=== RSA keygen wall time: serial vs parallel ({workers} workers) ===\n")
+    for bits in (2048, 3072, 4096):
+        serial = time_keygen(bits, parallel=False)
+        parallel = time_keygen(bits, parallel=True, workers=workers)
+        print(f"{bits:>5} bits  serial {serial:7.2f} s  "
+              f"parallel {parallel:7.2f} s  speedup {serial / parallel:5.2f}x")
+
+if __name__ == "__main__":
+    main()
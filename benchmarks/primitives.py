@@ -0,0 +1,154 @@
+import sys
+import os
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from shared import encryption
+
+# Benchmark suite for shared/encryption.py. Results go out as JSON so runs can be
+# diffed between versions, e.g.
+#   python primitives.py --output before.json
+#   python primitives.py --compare before.json
+# Key and prime generation draw from secrets, so their times vary run to run: every
+# case reports percentiles over several runs, after discarding warm-up runs.
+
+SIZES = (1024, 2048, 3072, 4096)
+MESSAGE = bytes(range(16))  # an AES session key, as in the handshake
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def measure(fn, runs, warmup, inner=1):
+    """Seconds per call of fn: warm-up runs are discarded, each sample averages inner calls"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(inner):
+            fn()
+        samples.append((time.perf_counter() - start) / inner)
+    return {
+        "runs": runs,
+        "warmup": warmup,
+        "inner": inner,
+        "min": min(samples),
+        "p50": percentile(samples, 0.50),
+        "p95": percentile(samples, 0.95),
+        "max": max(samples),
+        "mean": statistics.fmean(samples),
+    }
+
+
+def cases(bits, args):
+    """(name, fn, runs, warmup, inner) for one key size"""
+    public_key, private_key = encryption.generate_keys(bits)
+    k = (bits + 7) // 8
+    prime = encryption.generate_prime(bits // 2)
+    encoded = encryption.oaep_encode(MESSAGE, k)
+    ciphertext = encryption.encrypt_oaep(MESSAGE, public_key)
+    seed = bytes(encryption.HASH_LEN)
+
+    slow = (args.keygen_runs, args.keygen_warmup, 1)
+    fast = (args.runs, args.warmup, args.inner)
+    return [
+        ("generate_prime", lambda: encryption.generate_prime(bits // 2), *slow),
+        ("generate_keys", lambda: encryption.generate_keys(bits), *slow),
+        ("is_prime", lambda: encryption.is_prime(prime), args.runs, args.warmup, max(args.inner // 10, 1)),
+        ("mgf1", lambda: encryption.mgf1(seed, k - encryption.HASH_LEN - 1), *fast),
+        ("oaep_encode", lambda: encryption.oaep_encode(MESSAGE, k), *fast),
+        ("oaep_decode", lambda: encryption.oaep_decode(encoded, k), *fast),
+        ("encrypt_oaep", lambda: encryption.encrypt_oaep(MESSAGE, public_key), *fast),
+        ("decrypt_oaep", lambda: encryption.decrypt_oaep(ciphertext, private_key),
+         args.runs, args.warmup, max(args.inner // 10, 1)),
+    ]
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    random.seed(args.seed)  # Miller-Rabin witnesses; primes themselves come from secrets
+    results = {
+        "suite": "encryption-primitives",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "bigint_backend": encryption.backend,  # CHAT_BIGINT=python|gmpy2 to compare them
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": {},
+    }
+    for bits in args.sizes:
+        for name, fn, runs, warmup, inner in cases(bits, args):
+            stats = measure(fn, runs, warmup, inner)
+            results["results"][f"{name}/{bits}"] = stats
+            print(f"{name:>15} {bits:>5}  p50 {stats['p50'] * 1e3:10.3f} ms  "
+                  f"p95 {stats['p95'] * 1e3:10.3f} ms  ({runs} runs, {warmup} warm-up)", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print p50 ratios against baseline; True if any case got slower than threshold"""
+    regressed = False
+    print(f"\n=== p50 vs {baseline.get('revision') or 'baseline'} ===", file=sys.stderr)
+    for case, stats in results["results"].items():
+        before = baseline.get("results", {}).get(case)
+        if before is None:
+            continue
+        ratio = stats["p50"] / before["p50"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{case:>22}  {ratio:6.2f}x{flag}", file=sys.stderr)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark shared/encryption.py primitives")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--runs", type=int, default=30, help="measured runs of the fast operations")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--inner", type=int, default=100, help="calls averaged per sample of a fast operation")
+    parser.add_argument("--keygen-runs", type=int, default=5, help="measured runs of prime and key generation")
+    parser.add_argument("--keygen-warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare p50s against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative p50 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import sys
+import os
+import asyncio
+import json
+import subprocess
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import websockets
+from shared import encryption
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PORT = 6790
+CLIENTS = 20
+MESSAGES_PER_CLIENT = 100
+IDLE_TIMEOUT = 2.0  # stop counting once nothing has arrived for this long
+
+
+async def connect(public_key):
+    websocket = await websockets.connect(f"ws://127.0.0.1:{PORT}", max_queue=None)
+    await websocket.send(json.dumps({"type": "ISC", "key": public_key, "room": "bench"}))
+    await websocket.recv()
+    return websocket
+
+
+async def receive(websocket, counts):
+    try:
+        while True:
+            await asyncio.wait_for(websocket.recv(), IDLE_TIMEOUT)
+            counts[0] += 1
+            counts[1] = time.perf_counter()
+    except asyncio.TimeoutError:
+        pass
+
+
+async def run_load():
+    public_key, _ = encryption.generate_keys(1024)
+    clients = [await connect(public_key) for _ in range(CLIENTS)]
+    counts = [0, None]  # delivered, time of last delivery
+    frame = os.urandom(64)
+
+    start = time.perf_counter()
+    receivers = [asyncio.create_task(receive(ws, counts)) for ws in clients]
+    for _ in range(MESSAGES_PER_CLIENT):
+        await asyncio.gather(*[ws.send(frame) for ws in clients])
+    await asyncio.gather(*receivers)
+    elapsed = (counts[1] or time.perf_counter()) - start
+
+    for ws in clients:
+        await ws.close()
+    return counts[0], elapsed
+
+
+def measure(workers):
+    # Big outbound queues so the count measures throughput rather than drop policy
+    env = dict(os.environ, CHAT_OUTBOUND_QUEUE_SIZE="100000")
+    server = subprocess.Popen([sys.executable, "server.py", "--workers", str(workers), "--port", str(PORT)],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        time.sleep(1.5 + 0.5 * workers)
+        delivered, elapsed = asyncio.run(run_load())
+    finally:
+        server.terminate()
+        server.wait()
+    return delivered, elapsed
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1, 2, 4]
+    expected = CLIENTS * MESSAGES_PER_CLIENT * (CLIENTS - 1)
+    print(f"=== Delivered messages/sec by worker count ({CLIENTS} clients, one room) ===\n")
+    for workers in counts:
+        delivered, elapsed = measure(workers)
+        print(f"{workers:>3} workers  {delivered:>8}/{expected} delivered  {delivered / elapsed:10.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
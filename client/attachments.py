@@ -0,0 +1,178 @@
+import hashlib
+import json
+import mmap
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from shared import framing
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+
+CHUNK_SIZE = 64 * 1024  # multiple of the AES block size, so chunks map onto CTR counters
+DOWNLOAD_DIR = os.path.join(os.path.expanduser("~"), "Downloads", "RSA-ChatApp")
+
+
+def aes_ctr(data, key: bytes, nonce: bytes, index):
+    """Encrypt/decrypt chunk index of a transfer; each chunk starts at its own counter"""
+    counter = (int.from_bytes(nonce, "big") + index * (CHUNK_SIZE // 16)) % (1 << 128)
+    cipher = Cipher(algorithms.AES(key), modes.CTR(counter.to_bytes(16, "big")), backend=default_backend())
+    encryptor = cipher.encryptor()
+    return encryptor.update(data) + encryptor.finalize()
+
+
+def iter_chunks(path):
+    """Yield the file in CHUNK_SIZE pieces, through mmap where the file allows it"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        except (OSError, ValueError):
+            mapped = None
+
+        if mapped is None:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+        else:
+            with mapped:
+                for offset in range(0, size, CHUNK_SIZE):
+                    yield mapped[offset:offset + CHUNK_SIZE]
+
+
+def outgoing_frames(path, username, key: bytes, seal):
+    """Frames of one transfer: START (sealed metadata), DATA chunks, END (sealed digest)
+
+    seal(plaintext) -> bytes is the chat AES-CBC encryption with the session key.
+    Yields (frame, bytes sent so far, total size).
+    """
+    transfer_id = os.urandom(16)
+    nonce = os.urandom(16)
+    size = os.path.getsize(path)
+    meta = {"name": os.path.basename(path), "size": size, "username": username, "nonce": nonce.hex()}
+    yield framing.pack_attachment(transfer_id, framing.ATTACHMENT_START, 0,
+                                  seal(json.dumps(meta).encode())), 0, size
+
+    digest = hashlib.sha256()
+    sent = 0
+    for index, chunk in enumerate(iter_chunks(path)):
+        digest.update(chunk)
+        sent += len(chunk)
+        yield framing.pack_attachment(transfer_id, framing.ATTACHMENT_DATA, index,
+                                      aes_ctr(chunk, key, nonce, index)), sent, size
+
+    yield framing.pack_attachment(transfer_id, framing.ATTACHMENT_END, 0,
+                                  seal(digest.hexdigest().encode())), sent, size
+
+
+class IncomingTransfer:
+    def __init__(self, meta, directory):
+        self.name = os.path.basename(meta["name"]) or "attachment"
+        if type(meta["size"]) is not int or meta["size"] < 0:
+            raise ValueError("Attachment size must be a non-negative integer")
+        self.size = meta["size"]
+        self.username = meta.get("username", "")
+        self.nonce = bytes.fromhex(meta["nonce"])
+        self.received = 0
+        self.digest = hashlib.sha256()
+        os.makedirs(directory, exist_ok=True)
+        self.path = self._free_path(directory)
+        self.file = open(self.path + ".part", "wb")
+
+    def _free_path(self, directory):
+        base, ext = os.path.splitext(self.name)
+        path = os.path.join(directory, self.name)
+        n = 1
+        while os.path.exists(path) or os.path.exists(path + ".part"):
+            path = os.path.join(directory, f"{base} ({n}){ext}")
+            n += 1
+        return path
+
+    def write(self, index, data):
+        # The index comes from the peer: a chunk outside the announced size would make
+        # seek() grow a sparse file of any size
+        offset = index * CHUNK_SIZE
+        if offset >= self.size or len(data) > min(CHUNK_SIZE, self.size - offset):
+            raise ValueError(f"Attachment {self.name} sent a chunk outside its {self.size} bytes")
+        if self.received + len(data) > self.size:
+            raise ValueError(f"Attachment {self.name} sent more than its {self.size} bytes")
+        # Chunks go straight to disk at their offset; nothing is buffered in memory
+        self.file.seek(offset)
+        self.file.write(data)
+        self.digest.update(data)
+        self.received += len(data)
+
+    def finish(self, expected_digest):
+        self.file.close()
+        if self.digest.hexdigest() != expected_digest:
+            os.remove(self.path + ".part")
+            raise ValueError(f"Attachment {self.name} is corrupt or incomplete")
+        os.replace(self.path + ".part", self.path)
+        return self.path
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.path + ".part")
+
+
+class AttachmentReceiver:
+    """Reassembles incoming transfers on disk
+
+    handle() returns None for frames it drops: those of transfers this receiver never
+    saw start (e.g. it joined mid-transfer) or has given up on, whose remaining frames
+    are ignored. Otherwise it returns a (event, transfer) pair with event "progress"
+    or "done".
+    """
+
+    def __init__(self, directory=DOWNLOAD_DIR):
+        self.directory = directory
+        self.transfers = {}
+        self.aborted = set()  # ids of transfers whose START was unusable or that failed midway
+
+    def handle(self, frame, key: bytes, unseal):
+        transfer_id, kind, index, payload = framing.unpack_attachment(frame)
+
+        if kind == framing.ATTACHMENT_START:
+            if transfer_id in self.transfers or transfer_id in self.aborted:
+                return None
+            try:
+                meta = json.loads(unseal(payload))
+                transfer = IncomingTransfer(meta, self.directory)
+            except (KeyError, TypeError, ValueError):
+                self.aborted.add(transfer_id)
+                return None
+            self.transfers[transfer_id] = transfer
+            return "progress", transfer
+
+        transfer = self.transfers.get(transfer_id)
+        if transfer is None:
+            if kind == framing.ATTACHMENT_END:
+                self.aborted.discard(transfer_id)  # nothing more of it will come
+            return None
+
+        if kind == framing.ATTACHMENT_DATA:
+            try:
+                transfer.write(index, aes_ctr(payload, key, transfer.nonce, index))
+            except ValueError:
+                del self.transfers[transfer_id]
+                self.aborted.add(transfer_id)
+                transfer.abort()
+                raise
+            return "progress", transfer
+
+        del self.transfers[transfer_id]
+        try:
+            transfer.finish(unseal(payload).decode())
+        except Exception:
+            if not transfer.file.closed:
+                transfer.abort()
+            raise
+        return "done", transfer
+
+    def close(self):
+        for transfer in self.transfers.values():
+            transfer.abort()
+        self.transfers.clear()
+        self.aborted.clear()
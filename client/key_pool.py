@@ -0,0 +1,144 @@
+import json
+import multiprocessing
+import os
+import sys
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from shared import encryption
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+DEFAULT_POOL_PATH = os.path.join(os.path.expanduser("~"), ".rsa_chatapp", "keypool.json")
+
+
+class KeyPool:
+    """On-disk pool of pre-generated RSA keypairs, keyed by key size
+
+    take() pops a keypair in constant time; every keypair handed out is removed
+    from the file, so it is never reused. When a size drops to low_water keys a
+    background process tops it back up to target.
+    """
+
+    def __init__(self, path=DEFAULT_POOL_PATH, target=4, low_water=2):
+        self.path = path
+        self.target = target
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._refills = {}
+
+    def take(self, bit_length):
+        """Return a fresh (public_key, private_key), generating inline only if the pool is empty"""
+        with self._locked() as pool:
+            entries = pool.get(str(bit_length), [])
+            entry = entries.pop() if entries else None
+            remaining = len(entries)
+
+        self.refill(bit_length, remaining)
+
+        if entry is None:
+            return encryption.generate_keys(bit_length, parallel=bit_length >= 2048)
+        return _decode_keypair(entry)
+
+    def size(self, bit_length):
+        with self._locked() as pool:
+            return len(pool.get(str(bit_length), []))
+
+    def refill(self, bit_length, remaining=None):
+        """Start a background refill for bit_length if it is running low"""
+        if remaining is None:
+            remaining = self.size(bit_length)
+        if remaining > self.low_water:
+            return
+
+        proc = self._refills.get(bit_length)
+        if proc is not None and proc.is_alive():
+            return
+
+        # A daemon process keeps keygen off the GUI thread (and its GIL) and dies with the app
+        proc = multiprocessing.Process(target=_refill_worker,
+                                       args=(self.path, bit_length, self.target),
+                                       daemon=True)
+        proc.start()
+        self._refills[bit_length] = proc
+
+    def add(self, bit_length, keypair):
+        with self._locked() as pool:
+            pool.setdefault(str(bit_length), []).append(_encode_keypair(keypair))
+            return len(pool[str(bit_length)])
+
+    def _locked(self):
+        return _PoolFile(self.path, self._lock)
+
+
+class _PoolFile:
+    """Context manager: lock the pool file, yield its contents, write them back on exit"""
+
+    def __init__(self, path, lock):
+        self.path = path
+        self.lock = lock
+        self.fd = None
+        self.pool = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+            # Private keys live here: owner read/write only
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            with open(self.fd, "r", closefd=False) as f:
+                raw = f.read()
+            self.pool = json.loads(raw) if raw else {}
+        except Exception:
+            self._release()
+            raise
+        return self.pool
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                data = json.dumps(self.pool).encode()
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                os.ftruncate(self.fd, 0)
+                os.write(self.fd, data)
+                os.fsync(self.fd)
+        finally:
+            self._release()
+
+    def _release(self):
+        if self.fd is not None:
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+        self.lock.release()
+
+
+def _encode_keypair(keypair):
+    (e, n), private_key = keypair
+    return {"e": e, "n": n, "d": private_key.d, "p": private_key.p, "q": private_key.q}
+
+
+def _decode_keypair(entry):
+    n = entry["n"]
+    return (entry["e"], n), encryption.PrivateKey(entry["d"], n, entry["p"], entry["q"])
+
+
+def _refill_worker(path, bit_length, target):
+    pool = KeyPool(path)
+    while pool.size(bit_length) < target:
+        pool.add(bit_length, encryption.generate_keys(bit_length))
+
+
+if __name__ == "__main__":
+    # Pre-fill the pool, e.g. `python key_pool.py 2048 4096`
+    sizes = [int(arg) for arg in sys.argv[1:]] or [2048]
+    pool = KeyPool()
+    for bits in sizes:
+        _refill_worker(pool.path, bits, pool.target)
+        print(f"✅ {pool.size(bits)} keypairs of {bits} bits in {pool.path}")
@@ -0,0 +1,153 @@
+import hashlib
+import hmac
+import os
+import re
+import sqlite3
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from shared import envelope
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".rsa_chatapp")
+PAGE_SIZE = 100
+WORD = re.compile(r"\w+")  # what search treats as a word
+TOKEN_LENGTH = 16  # hex digits of a word's keyed hash kept in the index
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    room TEXT NOT NULL,
+    is_user INTEGER NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_room ON messages (room, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (tokens, content='', detail=none);
+CREATE TABLE IF NOT EXISTS rooms (
+    room TEXT PRIMARY KEY,
+    last_seq INTEGER NOT NULL,
+    epoch TEXT
+);
+"""
+
+
+class StoredMessage:
+    __slots__ = ("id", "username", "msg", "timestamp", "is_user")
+
+    def __init__(self, id, username, msg, timestamp, is_user):
+        self.id = id
+        self.username = username
+        self.msg = msg
+        self.timestamp = timestamp  # ms since the epoch
+        self.is_user = is_user
+
+
+class MessageStore:
+    """Local chat history in SQLite, encrypted at rest
+
+    Each message is kept as a binary envelope sealed with AES-GCM under a local key
+    (store.key, owner read/write only). Search goes through a contentless FTS5 index
+    of keyed hashes of each message's distinct words, with detail=none, so it keeps
+    no words, positions or counts. It does still show which stored messages share a
+    word. Matches are decrypted one page at a time, like history.
+    """
+
+    def __init__(self, directory=DEFAULT_STORE_DIR):
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        key = _load_key(os.path.join(directory, "store.key"))
+        self.aead = AESGCM(key)
+        self.index_key = hmac.new(key, b"search index", hashlib.sha256).digest()
+        path = os.path.join(directory, "history.db")
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def _tokens(self, text):
+        """Index tokens of the distinct words in text, in no particular order"""
+        return {hmac.new(self.index_key, word.encode(), hashlib.sha256).hexdigest()[:TOKEN_LENGTH]
+                for word in WORD.findall(text.casefold())}
+
+    def record(self, room, messages, last_seq=None):
+        """Store (username, msg, timestamp ms, is_user) tuples in one transaction"""
+        with self.db:
+            for username, msg, timestamp, is_user in messages:
+                if timestamp is None:
+                    timestamp = envelope.now_ms()
+                nonce = os.urandom(12)
+                body = nonce + self.aead.encrypt(nonce, envelope.encode(username, msg, timestamp),
+                                                 room.encode())
+                cur = self.db.execute("INSERT INTO messages (room, is_user, body) VALUES (?, ?, ?)",
+                                      (room, int(is_user), body))
+                self.db.execute("INSERT INTO messages_fts (rowid, tokens) VALUES (?, ?)",
+                                (cur.lastrowid, " ".join(self._tokens(f"{username} {msg}"))))
+            if last_seq is not None:
+                self.db.execute("INSERT INTO rooms (room, last_seq) VALUES (?, ?) "
+                                "ON CONFLICT (room) DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq)",
+                                (room, last_seq))
+
+    def last_seq(self, room):
+        """Highest server sequence number stored for room, to ask the server only for newer messages"""
+        row = self.db.execute("SELECT last_seq FROM rooms WHERE room = ?", (room,)).fetchone()
+        return row[0] if row else 0
+
+    def epoch(self, room):
+        """Server epoch last_seq(room) belongs to, None if unknown"""
+        row = self.db.execute("SELECT epoch FROM rooms WHERE room = ?", (room,)).fetchone()
+        return row[0] if row else None
+
+    def set_epoch(self, room, epoch):
+        """Start over at seq 0 under a new server epoch (the server's sequences restarted)"""
+        with self.db:
+            self.db.execute("INSERT INTO rooms (room, last_seq, epoch) VALUES (?, 0, ?) "
+                            "ON CONFLICT (room) DO UPDATE SET last_seq = 0, epoch = excluded.epoch",
+                            (room, epoch))
+
+    def page(self, room, before=None, limit=PAGE_SIZE):
+        """Up to limit messages of room older than message id before, oldest first"""
+        if before is None:
+            rows = self.db.execute("SELECT id, is_user, body FROM messages WHERE room = ? "
+                                   "ORDER BY id DESC LIMIT ?", (room, limit))
+        else:
+            rows = self.db.execute("SELECT id, is_user, body FROM messages WHERE room = ? AND id < ? "
+                                   "ORDER BY id DESC LIMIT ?", (room, before, limit))
+        return self._open(room, rows)[::-1]
+
+    def search(self, room, query, limit=PAGE_SIZE):
+        """Newest messages of room matching every word of query"""
+        terms = " ".join(self._tokens(query))
+        if not terms:
+            return []
+        rows = self.db.execute("SELECT m.id, m.is_user, m.body FROM messages_fts "
+                               "JOIN messages m ON m.id = messages_fts.rowid "
+                               "WHERE messages_fts MATCH ? AND m.room = ? "
+                               "ORDER BY m.id DESC LIMIT ?", (terms, room, limit))
+        return self._open(room, rows)
+
+    def _open(self, room, rows):
+        messages = []
+        for id, is_user, body in rows:
+            decoded = envelope.decode(self.aead.decrypt(body[:12], body[12:], room.encode()))
+            messages.append(StoredMessage(id, decoded["username"], decoded["msg"],
+                                          decoded["timestamp"], bool(is_user)))
+        return messages
+
+    def close(self):
+        self.db.close()
+
+
+def _load_key(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    key = AESGCM.generate_key(bit_length=256)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return _load_key(path)  # another window created it first
+    with open(fd, "wb") as f:
+        f.write(key)
+    return key
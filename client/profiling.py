@@ -0,0 +1,143 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+# Opt-in timing spans for the client's send and receive pipelines. Set CHAT_TRACE to a
+# file path (or call enable()) and every span is recorded; on exit they are written in
+# Chrome trace format (open in chrome://tracing or https://ui.perfetto.dev) with
+# per-span duration histograms under "otherData". While disabled, span() hands back
+# one shared no-op context manager, so instrumented code pays a call and a branch.
+
+MAX_EVENTS = 1_000_000    # beyond this only the histograms keep counting
+BUCKETS_PER_OCTAVE = 8    # histogram resolution, about 9% per bucket
+
+enabled = False
+trace_path = None
+events = []
+histograms = {}  # span name -> {"count", "total_us", "max_us", "buckets": {index: count}}
+_lock = threading.Lock()
+_thread_names = {}
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "category", "start")
+
+    def __init__(self, name, category):
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.name, self.start, time.perf_counter_ns(), self.category)
+        return False
+
+
+def span(name, category="client"):
+    """Context manager timing the block as one span; a no-op unless profiling is enabled"""
+    if not enabled:
+        return NULL_SPAN
+    return _Span(name, category)
+
+
+def now():
+    """Timestamp for record(); 0 while disabled so callers can skip the clock read"""
+    return time.perf_counter_ns() if enabled else 0
+
+
+def record(name, start_ns, end_ns, category="client"):
+    """Add a span measured elsewhere, e.g. across threads"""
+    if not enabled:
+        return
+    duration_us = (end_ns - start_ns) / 1000
+    thread = threading.current_thread()
+    with _lock:
+        _thread_names.setdefault(thread.ident, thread.name)
+        if len(events) < MAX_EVENTS:
+            events.append({"name": name, "cat": category, "ph": "X", "ts": start_ns / 1000,
+                           "dur": duration_us, "pid": os.getpid(), "tid": thread.ident})
+        stats = histograms.get(name)
+        if stats is None:
+            stats = histograms[name] = {"count": 0, "total_us": 0.0, "max_us": 0.0, "buckets": {}}
+        stats["count"] += 1
+        stats["total_us"] += duration_us
+        stats["max_us"] = max(stats["max_us"], duration_us)
+        index = int(math.log2(max(duration_us, 1)) * BUCKETS_PER_OCTAVE)
+        stats["buckets"][index] = stats["buckets"].get(index, 0) + 1
+
+
+def _percentile(stats, q):
+    target = q * stats["count"]
+    seen = 0
+    for index in sorted(stats["buckets"]):
+        seen += stats["buckets"][index]
+        if seen >= target:
+            return min(2 ** ((index + 1) / BUCKETS_PER_OCTAVE), stats["max_us"])
+    return stats["max_us"]
+
+
+def summary():
+    """name -> count, mean, p50, p95, p99 and max in microseconds"""
+    with _lock:
+        return {name: {"count": stats["count"],
+                       "mean_us": stats["total_us"] / stats["count"],
+                       "p50_us": _percentile(stats, 0.50),
+                       "p95_us": _percentile(stats, 0.95),
+                       "p99_us": _percentile(stats, 0.99),
+                       "max_us": stats["max_us"]}
+                for name, stats in histograms.items()}
+
+
+def write(path=None):
+    """Write the trace file; returns its path, or None if nothing was recorded"""
+    path = path or trace_path
+    if path is None or not histograms:
+        return None
+    stats = summary()
+    with _lock:
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                    for tid, name in _thread_names.items()]
+        trace = {"traceEvents": metadata + events, "displayTimeUnit": "ms",
+                 "otherData": {"histograms": stats, "dropped_events": max(sum(
+                     s["count"] for s in histograms.values()) - len(events), 0)}}
+    with open(path, "w") as f:
+        json.dump(trace, f)
+    return path
+
+
+def enable(path):
+    global enabled, trace_path
+    trace_path = path
+    if not enabled:
+        enabled = True
+        atexit.register(_write_at_exit)
+
+
+def _write_at_exit():
+    path = write()
+    if path is None:
+        return
+    print(f"⏱️ Trace written to {path}")
+    for name, stats in sorted(summary().items(), key=lambda item: -item[1]["mean_us"] * item[1]["count"]):
+        print(f"  {name:<28} n={stats['count']:<7} p50 {stats['p50_us']:9.1f} us  "
+              f"p95 {stats['p95_us']:9.1f} us  max {stats['max_us']:9.1f} us")
+
+
+if os.environ.get("CHAT_TRACE"):
+    enable(os.environ["CHAT_TRACE"])
@@ -1,27 +1,46 @@
-from PyQt5.QtWidgets import QWidget, QScrollArea, QVBoxLayout
-from PyQt5.QtCore import QTimer
-from .message_bubble import MessageBubble
+import bisect
+from itertools import accumulate
+from PyQt5.QtWidgets import QAbstractScrollArea, QStyleOptionViewItem
+from PyQt5.QtGui import QPainter
+from PyQt5.QtCore import QRect, pyqtSignal
+from .message_model import ChatMessage, MessageListModel
+from .message_delegate import MessageBubbleDelegate
 from PyQt5.QtCore import Qt
+from profiling import span
+
+CONTENT_MARGIN = 10  # above the first and below the last message
+EXACT_APPEND_LIMIT = 500  # bigger appends start with estimated heights for wrapped rows
+
+class ChatScrollArea(QAbstractScrollArea):
+    """Chat history backed by MessageListModel and painted by MessageBubbleDelegate
+
+    Only row heights are kept for every message (as running offsets, so appending
+    is cheap and finding the visible rows is a bisect); painting touches nothing
+    but the rows in the viewport. After a resize or a large append, wrapped rows
+    start with estimated heights and are measured exactly when they scroll into view.
+    """
+
+    top_reached = pyqtSignal()  # scrolled to the oldest loaded message
 
-class ChatScrollArea(QScrollArea):
     def __init__(self):
         super().__init__()
-        self.setWidgetResizable(True)
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        self.verticalScrollBar().setSingleStep(20)
+        self.verticalScrollBar().valueChanged.connect(self._scrolled)
 
-        # Content widget
-        self.content_widget = QWidget()
-        self.content_layout = QVBoxLayout(self.content_widget)
-        self.content_layout.setSpacing(5)
-        self.content_layout.setContentsMargins(0, 10, 0, 10)
-        self.content_layout.addStretch()
+        self.message_model = MessageListModel(self)
+        self.delegate = MessageBubbleDelegate(self)
+        self.heights = []
+        self.offsets = [CONTENT_MARGIN]  # offsets[i] is the top of row i, offsets[-1] the end
+        self.layout_width = None
 
-        self.setWidget(self.content_widget)
+        self.message_model.rowsInserted.connect(self._rows_inserted)
+        self.message_model.modelReset.connect(self._relayout)
 
         # Style
         self.setStyleSheet("""
-            QScrollArea {
+            QAbstractScrollArea {
                 border: none;
                 background-color: #F2F2F7;
             }
@@ -41,13 +60,144 @@ class ChatScrollArea(QScrollArea):
         """)
 
     def add_message(self, message, username, is_user):
-        bubble = MessageBubble(message, username, is_user)
-        # Insert before the stretch
-        self.content_layout.insertWidget(self.content_layout.count() - 1, bubble)
+        # The user's own messages always bring the view down to them
+        self.add_messages([(message, username, is_user)], follow=is_user)
 
-        # Scroll to bottom
-        QTimer.singleShot(50, self.scroll_to_bottom)
+    def add_messages(self, entries, follow=False):
+        """Insert (message, username, is_user[, timestamp]) entries as one batch and scroll at most once
+
+        The view only follows new messages if it was already at the bottom (or follow is set),
+        so reading older history isn't interrupted.
+        """
+        follow = follow or self.is_at_bottom()
+        self.message_model.append([ChatMessage(*entry) for entry in entries])
+        if follow:
+            self.scroll_to_bottom()
+
+    def prepend_messages(self, entries):
+        """Insert older entries above the loaded ones without moving what is on screen"""
+        empty = not self.heights
+        self.message_model.prepend([ChatMessage(*entry) for entry in entries])
+        if empty:
+            self.scroll_to_bottom()
+
+    def is_at_bottom(self):
+        scrollbar = self.verticalScrollBar()
+        return scrollbar.value() >= scrollbar.maximum()
 
     def scroll_to_bottom(self):
         scrollbar = self.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
+
+    def _heights(self, items, exact):
+        width = self.viewport().width()
+        return [self.delegate.row_height(item, width, exact) for item in items]
+
+    def _rows_inserted(self, parent, first, last):
+        with span("layout_rows", "render"):
+            self._lay_out_rows(first, last)
+
+    def _lay_out_rows(self, first, last):
+        if first == 0 and self.heights:
+            self._rows_prepended(last + 1)
+            return
+        if first != len(self.heights):
+            self._relayout()
+            return
+        # Appended: extend the running offsets
+        items = self.message_model.messages[first:last + 1]
+        for height in self._heights(items, exact=len(items) <= EXACT_APPEND_LIMIT):
+            self.heights.append(height)
+            self.offsets.append(self.offsets[-1] + height)
+        self._update_scrollbar()
+        self.viewport().update()
+
+    def _rows_prepended(self, count):
+        items = self.message_model.messages[:count]
+        heights = self._heights(items, exact=count <= EXACT_APPEND_LIMIT)
+        self.heights[:0] = heights
+        self.offsets = list(accumulate(self.heights, initial=CONTENT_MARGIN))
+        # Keep the rows on screen in place: shift the scroll position by what was added above
+        scrollbar = self.verticalScrollBar()
+        value = scrollbar.value()
+        self._update_scrollbar()
+        scrollbar.setValue(value + sum(heights))
+        self.viewport().update()
+
+    def _scrolled(self, value):
+        if value == 0 and self.heights:
+            self.top_reached.emit()
+
+    def _relayout(self):
+        self.layout_width = self.viewport().width()
+        self.heights = self._heights(self.message_model.messages, exact=False)
+        self.offsets = list(accumulate(self.heights, initial=CONTENT_MARGIN))
+        self._update_scrollbar()
+        self.viewport().update()
+
+    def _visible_rows(self, top, bottom):
+        row = max(bisect.bisect_right(self.offsets, top) - 1, 0)
+        end = bisect.bisect_right(self.offsets, bottom, lo=row)
+        return range(row, min(end, len(self.heights)))
+
+    def _settle(self, rows):
+        """Replace estimated heights of rows about to be painted with exact ones"""
+        width = self.viewport().width()
+        messages = self.message_model.messages
+        changed = False
+        for row in rows:
+            item = messages[row]
+            if not self.delegate.is_laid_out(item, width):
+                height = self.delegate.row_height(item, width)
+                if height != self.heights[row]:
+                    self.heights[row] = height
+                    changed = True
+        if changed:
+            at_bottom = self.is_at_bottom()
+            self.offsets = list(accumulate(self.heights, initial=CONTENT_MARGIN))
+            self._update_scrollbar()
+            if at_bottom:
+                self.scroll_to_bottom()
+        return changed
+
+    def _update_scrollbar(self):
+        scrollbar = self.verticalScrollBar()
+        page = self.viewport().height()
+        scrollbar.setPageStep(page)
+        scrollbar.setRange(0, max(self.offsets[-1] + CONTENT_MARGIN - page, 0))
+
+    def resizeEvent(self, event):
+        at_bottom = self.is_at_bottom()
+        super().resizeEvent(event)
+        if self.viewport().width() != self.layout_width:
+            self._relayout()  # bubbles rewrap at the new width
+        else:
+            self._update_scrollbar()
+        if at_bottom:
+            self.scroll_to_bottom()
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+
+    def paintEvent(self, event):
+        with span("paint", "render"):
+            self._paint(event)
+
+    def _paint(self, event):
+        painter = QPainter(self.viewport())
+        top = self.verticalScrollBar().value()
+        clip = event.rect()
+        width = self.viewport().width()
+
+        option = QStyleOptionViewItem()
+        option.widget = self
+        option.font = self.font()
+
+        if self._settle(self._visible_rows(top, top + self.viewport().height())):
+            top = self.verticalScrollBar().value()
+            clip = self.viewport().rect()  # rows below the settled ones moved
+
+        for row in self._visible_rows(top + clip.top(), top + clip.bottom()):
+            option.rect = QRect(0, self.offsets[row] - top, width, self.heights[row])
+            self.delegate.paint(painter, option, self.message_model.index(row))
+        painter.end()
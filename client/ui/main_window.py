@@ -1,17 +1,27 @@
-import json
+import os
 import sys
-from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QInputDialog, QMessageBox
+from datetime import datetime
+from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QInputDialog, QMessageBox, QFileDialog
 from websocekt_client import WebSocketClient
+from key_pool import KeyPool
+from message_store import MessageStore
+import profiling
+from profiling import span
 from ui.chat_scroll_area import ChatScrollArea
+from ui.message_ingest import MessageIngestBuffer
 
 class ChatWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.websocket_client = None
+        self.room = "general"
+        self.store = MessageStore()
+        self.oldest_loaded = None  # store id of the oldest message on screen
         self.setWindowTitle("Conversation")
         self.setGeometry(100, 100, 400, 600)
-        self.setup_ui()
         self.get_user_info()
+        self.setup_ui()
+        self.load_older_messages()
         self.start_websocket()
 
     def setup_ui(self):
@@ -28,6 +38,7 @@ class ChatWindow(QMainWindow):
 
         # Chat area
         self.chat_area = ChatScrollArea()
+        self.chat_area.top_reached.connect(self.load_older_messages)
         layout.addWidget(self.chat_area)
 
         # Input area
@@ -54,7 +65,7 @@ class ChatWindow(QMainWindow):
         layout = QHBoxLayout(header)
         layout.setContentsMargins(15, 10, 15, 10)
 
-        name_label = QLabel("Chat Room")
+        name_label = QLabel(f"# {self.room}")
         name_label.setStyleSheet("""
             QLabel {
                 font-size: 18px;
@@ -64,8 +75,37 @@ class ChatWindow(QMainWindow):
             }
         """)
 
+        # File transfer progress, hidden while idle
+        self.transfer_label = QLabel()
+        self.transfer_label.setStyleSheet("""
+            QLabel {
+                font-size: 12px;
+                color: #666666;
+                border: none;
+            }
+        """)
+        self.transfer_label.hide()
+
+        # Search the local history
+        search_button = QPushButton("🔍")
+        search_button.setFixedSize(32, 32)
+        search_button.setStyleSheet("""
+            QPushButton {
+                background-color: #E5E5EA;
+                border: none;
+                border-radius: 16px;
+                font-size: 14px;
+            }
+            QPushButton:hover {
+                background-color: #D1D1D6;
+            }
+        """)
+        search_button.clicked.connect(self.search_history)
+
         layout.addWidget(name_label)
         layout.addStretch()
+        layout.addWidget(self.transfer_label)
+        layout.addWidget(search_button)
 
         return header
 
@@ -120,6 +160,24 @@ class ChatWindow(QMainWindow):
         """)
         send_button.clicked.connect(self.send_message)
 
+        # Attach button
+        attach_button = QPushButton("📎")
+        attach_button.setFixedSize(40, 40)
+        attach_button.setStyleSheet("""
+            QPushButton {
+                background-color: #E5E5EA;
+                border: none;
+                border-radius: 20px;
+                font-size: 16px;
+            }
+            QPushButton:hover {
+                background-color: #D1D1D6;
+            }
+        """)
+        attach_button.clicked.connect(self.send_file)
+
+        layout.addWidget(attach_button)
+        layout.addSpacing(5)
         layout.addWidget(self.message_input)
         layout.addSpacing(5)
         layout.addWidget(send_button)
@@ -143,6 +201,12 @@ class ChatWindow(QMainWindow):
 
         self.username = username
 
+        # Get room to join
+        room, ok = QInputDialog.getText(pop, "Room", "Room to join:", text=self.room)
+        if not ok:
+            sys.exit()
+        self.room = room.strip() or self.room
+
         # Get RSA key size
         key_sizes = ["1024", "2048", "3072", "4096"]
         key_size_str, ok = QInputDialog.getItem(pop, 
@@ -167,36 +231,102 @@ class ChatWindow(QMainWindow):
 
     def start_websocket(self):
         # 4.234.163.3
-        self.websocket_client = WebSocketClient("ws://4.234.163.3:6789", self.RSAKeySize)
+        # Keys come pre-generated from the on-disk pool; when it is empty the client
+        # generates them on its own thread before connecting, not on this one
+        self.websocket_client = WebSocketClient("ws://4.234.163.3:6789", self.RSAKeySize,
+                                                keyPool=KeyPool(),
+                                                room=self.room)
+        # Messages already in the local store are not replayed again
+        self.websocket_client.last_seq = self.store.last_seq(self.room)
+        self.websocket_client.epoch = self.store.epoch(self.room)
 
         # Connect signals
-        self.websocket_client.message_received.connect(self.handle_incoming_message)
+        # Messages are inserted in per-frame batches rather than one by one
+        self.ingest = MessageIngestBuffer(self)
+        self.ingest.batch_ready.connect(self.handle_incoming_messages)
+        self.websocket_client.messages_received.connect(self.ingest.push)
+        self.websocket_client.epoch_changed.connect(lambda epoch: self.store.set_epoch(self.room, epoch))
+        self.websocket_client.sent_acknowledged.connect(lambda seq: self.store.record(self.room, [], last_seq=seq))
         self.websocket_client.connected.connect(lambda: print("🟢 Connected to server"))
         self.websocket_client.disconnected.connect(lambda: print("🔴 Disconnected from server"))
         self.websocket_client.error.connect(lambda err: print(f"❌ WebSocket error: {err}"))
+        self.websocket_client.attachment_progress.connect(self.show_transfer_progress)
+        self.websocket_client.attachment_received.connect(self.handle_incoming_file)
 
         self.websocket_client.start()
 
     def send_message(self):
-        message = self.message_input.text().strip()
-        structured_msg = {"username": self.username, "msg": message}
-        if message:
-            self.chat_area.add_message(message, self.username, is_user=True)
-            self.message_input.clear()
-
-        # Send to WebSocket
-        if self.websocket_client:
-            self.websocket_client.send_message(json.dumps(structured_msg))
-
-
-    def handle_incoming_message(self, message):
-        try:
-            msg_obj = json.loads(message)
-            self.chat_area.add_message(msg_obj["msg"], is_user=False, username=msg_obj["username"])
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse message: {e}")
+        with span("send_message", "ui"):
+            message = self.message_input.text().strip()
+            if message:
+                with span("add_messages", "ui"):
+                    self.chat_area.add_message(message, self.username, is_user=True)
+                with span("store_record", "ui"):
+                    self.store.record(self.room, [(self.username, message, None, True)])
+                self.message_input.clear()
+
+            # Send to WebSocket
+            if self.websocket_client:
+                self.websocket_client.send_message(self.username, message)
+
+
+    def send_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Send file")
+        if not path:
+            return
+        if self.websocket_client and self.websocket_client.send_file(path, self.username):
+            self.chat_area.add_message(f"📎 {os.path.basename(path)}", self.username, is_user=True)
+
+    def show_transfer_progress(self, name, done, total):
+        if total and done < total:
+            self.transfer_label.setText(f"{name} {done * 100 // total}%")
+            self.transfer_label.show()
+        else:
+            self.transfer_label.hide()
+
+    def handle_incoming_file(self, username, name, path):
+        self.transfer_label.hide()
+        self.chat_area.add_message(f"📎 {name}\nSaved to {path}", is_user=False, username=username)
+
+    def handle_incoming_messages(self, messages):
+        # Already decoded off the GUI thread by the client
+        with span("handle_incoming_messages", "ui"):
+            with span("add_messages", "ui"):
+                self.chat_area.add_messages([(message["msg"], message["username"], False,
+                                              _sent_at(message["timestamp"])) for message in messages])
+            with span("store_record", "ui"):
+                self.store.record(self.room, [(message["username"], message["msg"], message["timestamp"], False)
+                                              for message in messages],
+                                  last_seq=max(message["room_seq"] for message in messages))
+
+    def load_older_messages(self):
+        """Load the page of stored history just before the oldest message on screen"""
+        page = self.store.page(self.room, before=self.oldest_loaded)
+        if not page:
+            return
+        self.oldest_loaded = page[0].id
+        self.chat_area.prepend_messages([(m.msg, m.username, m.is_user, _sent_at(m.timestamp)) for m in page])
+
+    def search_history(self):
+        query, ok = QInputDialog.getText(self, "Search", "Search messages:")
+        if not ok or not query.strip():
+            return
+        results = self.store.search(self.room, query, limit=20)
+        if not results:
+            QMessageBox.information(self, "Search", "No messages found.")
+            return
+        lines = [f"{m.username} • {_sent_at(m.timestamp):%d/%m %H:%M}: {m.msg}" for m in results]
+        QMessageBox.information(self, "Search", "\n\n".join(lines))
 
     def closeEvent(self, a0):
         if self.websocket_client:
             self.websocket_client.stop()
+        self.store.close()
+        if profiling.enabled:
+            profiling.write()
         a0.accept()
+
+
+def _sent_at(timestamp):
+    """datetime of a ms timestamp; messages from peers without timestamps show the arrival time"""
+    return datetime.fromtimestamp(timestamp / 1000) if timestamp else datetime.now()
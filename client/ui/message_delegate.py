@@ -0,0 +1,129 @@
+from PyQt5.QtWidgets import QStyledItemDelegate
+from PyQt5.QtGui import QColor, QFont, QFontMetrics
+from PyQt5.QtCore import Qt, QRect, QRectF, QSize
+from .message_model import MessageRole
+
+ROW_MARGIN_X = 10
+ROW_MARGIN_Y = 5
+HEADER_SPACING = 2
+BUBBLE_PADDING_X = 15
+BUBBLE_PADDING_Y = 10
+BUBBLE_RADIUS = 18
+BUBBLE_MAX_RATIO = 0.8  # of the row width
+
+USER_BUBBLE = QColor("#007AFF")
+USER_TEXT = QColor("white")
+PEER_BUBBLE = QColor("#E5E5EA")
+PEER_TEXT = QColor("black")
+USERNAME_COLOR = QColor("#666666")
+SEPARATOR_COLOR = QColor("#CCCCCC")
+TIME_COLOR = QColor("#999999")
+
+
+def _font(pixel_size, bold=False):
+    font = QFont()
+    font.setPixelSize(pixel_size)
+    font.setBold(bold)
+    return font
+
+
+class MessageBubbleDelegate(QStyledItemDelegate):
+    """Paints chat bubbles; the wrapped text size is cached on each message"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.text_font = _font(14)
+        self.username_font = _font(12, bold=True)
+        self.meta_font = _font(11)
+        self.text_metrics = QFontMetrics(self.text_font)
+        self.username_metrics = QFontMetrics(self.username_font)
+        self.meta_metrics = QFontMetrics(self.meta_font)
+        self.header_height = max(self.username_metrics.height(), self.meta_metrics.height())
+
+    def _row_width(self, option):
+        widget = option.widget
+        if widget is not None:
+            return widget.viewport().width()
+        return option.rect.width()
+
+    def is_laid_out(self, item, row_width):
+        return item.layout_width == row_width
+
+    def _text_size(self, item, row_width, exact=True):
+        if item.layout_width == row_width:
+            return item.text_size
+        max_text = max(int(row_width * BUBBLE_MAX_RATIO) - 2 * BUBBLE_PADDING_X, 1)
+        if item.natural_width is None:
+            item.natural_width = (-1 if "\n" in item.message
+                                  else self.text_metrics.horizontalAdvance(item.message))
+        if 0 <= item.natural_width <= max_text:
+            # Fits on one line: no wrapping to work out
+            size = QSize(item.natural_width, self.text_metrics.height())
+        elif not exact and item.natural_width > 0:
+            # Off-screen rows get an estimate; the view asks for the exact size before painting
+            lines = -(-item.natural_width // max_text)
+            return QSize(max_text, self.text_metrics.height() + (lines - 1) * self.text_metrics.lineSpacing())
+        else:
+            size = self.text_metrics.boundingRect(QRect(0, 0, max_text, 1 << 20),
+                                                  Qt.TextWordWrap, item.message).size()
+        item.text_size = size
+        item.layout_width = row_width
+        return size
+
+    def row_height(self, item, row_width, exact=True):
+        text = self._text_size(item, row_width, exact)
+        return (2 * ROW_MARGIN_Y + self.header_height + HEADER_SPACING +
+                text.height() + 2 * BUBBLE_PADDING_Y)
+
+    def sizeHint(self, option, index):
+        row_width = self._row_width(option)
+        return QSize(row_width, self.row_height(index.data(MessageRole), row_width))
+
+    def paint(self, painter, option, index):
+        item = index.data(MessageRole)
+        rect = option.rect
+        text = self._text_size(item, self._row_width(option))
+
+        painter.save()
+        painter.setRenderHint(painter.Antialiasing)
+
+        # Header: username • time, on the sender's side
+        top = rect.top() + ROW_MARGIN_Y
+        separator = " • "
+        name_w = self.username_metrics.horizontalAdvance(item.username)
+        sep_w = self.meta_metrics.horizontalAdvance(separator)
+        time_w = self.meta_metrics.horizontalAdvance(item.time_text)
+        header_w = name_w + sep_w + time_w
+        if item.is_user:
+            x = rect.right() - ROW_MARGIN_X - header_w
+        else:
+            x = rect.left() + ROW_MARGIN_X
+        for font, color, value, width in ((self.username_font, USERNAME_COLOR, item.username, name_w),
+                                          (self.meta_font, SEPARATOR_COLOR, separator, sep_w),
+                                          (self.meta_font, TIME_COLOR, item.time_text, time_w)):
+            painter.setFont(font)
+            painter.setPen(color)
+            painter.drawText(QRect(x, top, width, self.header_height), Qt.AlignVCenter, value)
+            x += width
+
+        # Bubble
+        bubble_w = text.width() + 2 * BUBBLE_PADDING_X
+        bubble_h = text.height() + 2 * BUBBLE_PADDING_Y
+        bubble_top = top + self.header_height + HEADER_SPACING
+        if item.is_user:
+            bubble_left = rect.right() - ROW_MARGIN_X - bubble_w
+        else:
+            bubble_left = rect.left() + ROW_MARGIN_X
+        bubble = QRectF(bubble_left, bubble_top, bubble_w, bubble_h)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(USER_BUBBLE if item.is_user else PEER_BUBBLE)
+        painter.drawRoundedRect(bubble, BUBBLE_RADIUS, BUBBLE_RADIUS)
+
+        painter.setFont(self.text_font)
+        painter.setPen(USER_TEXT if item.is_user else PEER_TEXT)
+        # Rewrapping at exactly the measured width can break a line that fits
+        flags = Qt.TextWordWrap if text.height() > self.text_metrics.height() else Qt.TextSingleLine
+        painter.drawText(QRect(bubble_left + BUBBLE_PADDING_X, bubble_top + BUBBLE_PADDING_Y,
+                               text.width(), text.height()),
+                         flags, item.message)
+        painter.restore()
@@ -0,0 +1,37 @@
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+import profiling
+from profiling import span
+
+FRAME_INTERVAL_MS = 16  # about one frame at 60 Hz
+
+
+class MessageIngestBuffer(QObject):
+    """Collects incoming messages on the GUI thread and hands them on once per frame
+
+    A burst of messages then costs one model insert and one scroll instead of one each.
+    """
+
+    batch_ready = pyqtSignal(list)
+
+    def __init__(self, parent=None, interval=FRAME_INTERVAL_MS):
+        super().__init__(parent)
+        self.pending = []
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.flush)
+
+    def push(self, messages):
+        if profiling.enabled and "_emitted_ns" in messages[0]:
+            # Time from the client thread's emit until the GUI thread ran this slot
+            profiling.record("signal_dispatch", messages[0].pop("_emitted_ns"), profiling.now(), "receive")
+        self.pending.extend(messages)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        self.timer.stop()
+        batch, self.pending = self.pending, []
+        if batch:
+            with span("ingest_flush", "ui"):
+                self.batch_ready.emit(batch)
@@ -0,0 +1,55 @@
+from datetime import datetime
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex
+
+MessageRole = Qt.UserRole + 1
+
+
+class ChatMessage:
+    __slots__ = ("message", "username", "is_user", "time_text",
+                 "natural_width", "layout_width", "text_size")
+
+    def __init__(self, message, username, is_user, timestamp=None):
+        self.message = message
+        self.username = username
+        self.is_user = is_user
+        self.time_text = (timestamp or datetime.now()).strftime("%H:%M")
+        # Text layout, cached by the delegate: unwrapped width, and wrapped size for one row width
+        self.natural_width = None
+        self.layout_width = None
+        self.text_size = None
+
+
+class MessageListModel(QAbstractListModel):
+    """Plain list of ChatMessage rows; all drawing is left to the delegate"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.messages = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.messages)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self.messages[index.row()]
+        if role == MessageRole:
+            return item
+        if role == Qt.DisplayRole:
+            return item.message
+        return None
+
+    def append(self, items):
+        if not items:
+            return
+        row = len(self.messages)
+        self.beginInsertRows(QModelIndex(), row, row + len(items) - 1)
+        self.messages.extend(items)
+        self.endInsertRows()
+
+    def prepend(self, items):
+        if not items:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(items) - 1)
+        self.messages[:0] = items
+        self.endInsertRows()
@@ -1,9 +1,14 @@
 import asyncio
 import json
 import os
+import struct
 import threading
+import zlib
 import websockets
-from shared import encryption
+import profiling
+from profiling import span
+from shared import encryption, framing, compression, envelope, handshake_codec
+from attachments import AttachmentReceiver, outgoing_frames
 from PyQt5.QtCore import QObject, pyqtSignal
 from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
@@ -33,41 +38,106 @@ def aes_cbc_decrypt(ciphertext: bytes, key: bytes, iv: bytes):
     padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
     return unpad(padded_plaintext)
 
+# --- Step 4: Coalesced multi-message frames ---
+COALESCE_WINDOW = 0.01  # seconds to wait for more messages before sending a frame
+MAX_BATCH = 64
+BATCH_MAGIC = b"\x00B"  # envelopes start with {" or \x00E, so single messages stay unambiguous
+BATCH_LENGTH = struct.Struct("!I")
+
+def pack_batch(messages):
+    """Plaintext for one frame: a single encoded envelope as-is, several behind BATCH_MAGIC"""
+    if len(messages) == 1:
+        return messages[0]
+    parts = [BATCH_MAGIC]
+    for data in messages:
+        parts.append(BATCH_LENGTH.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+def unpack_batch(plaintext):
+    if not plaintext.startswith(BATCH_MAGIC):
+        return [plaintext]
+    messages = []
+    offset = len(BATCH_MAGIC)
+    while offset < len(plaintext):
+        (length,) = BATCH_LENGTH.unpack_from(plaintext, offset)
+        offset += BATCH_LENGTH.size
+        messages.append(plaintext[offset:offset + length])
+        offset += length
+    return messages
+
+NO_FILE_TRANSFERS = "Files can't be sent here: someone in the room can't receive them"
+
 class WebSocketClient(QObject):
-    message_received = pyqtSignal(str)
+    messages_received = pyqtSignal(list)  # decoded envelope dicts, one emit per incoming frame
+    epoch_changed = pyqtSignal(str)       # the server's room sequences restarted; last_seq is back to 0
+    sent_acknowledged = pyqtSignal(int)   # room seq the server gave one of our own frames
     connected = pyqtSignal()
     disconnected = pyqtSignal()
     error = pyqtSignal(str)
+    attachment_progress = pyqtSignal(str, int, int)      # file name, bytes done, total bytes
+    attachment_received = pyqtSignal(str, str, str)      # username, file name, saved path
 
-    def __init__(self, uri, rsaKeySize):
+    def __init__(self, uri, rsaKeySize, parallelKeygen=False, keyPool=None, room="general"):
         super().__init__()
         self.uri = uri
+        self.room = room
         self.keep_running = True
         self.websocket = None
         self.loop = None
         self.worker_thread = None
-        self.public_key, self.private_key = encryption.generate_keys(rsaKeySize)
+        # Keys are taken or generated on the worker thread, so the window opens at once
+        self.rsa_key_size = rsaKeySize
+        self.parallel_keygen = parallelKeygen  # only used without a pool, which picks its own mode
+        self.key_pool = keyPool
+        self.public_key = self.private_key = None
         self.aes_key = bytes(16)
+        self.outbox = None     # asyncio.Queue on the client loop, fed by send_message
+        self.key_ready = None  # set once the session key has arrived
+        # Formats the room can read, from the handshake and later control frames
+        self.compress = False
+        self.binary_envelope = False  # JSON otherwise
+        self.batching = False  # several messages per frame
+        self.file_transfers = False  # attachments; every member must be able to take them
+        self.compression_stats = compression.new_stats()
+        # Set False for servers that predate the binary handshake. There is no automatic
+        # fallback: such a server keeps the failed connection in its client set and
+        # disconnects the next sender when relaying to it fails.
+        self.binary_handshake = True
+        self.sequenced = True  # False for servers that relay bare IV + ciphertext frames
+        self.envelope_seq = 0  # per-sender counter carried in binary envelopes
+        self.attachments = AttachmentReceiver()
+        self.last_seq = 0  # highest sequence number received, for catch-up on (re)connect
+        self.epoch = None  # the server run last_seq belongs to
 
     async def listen(self):
+        sender = None
         try:
             async with websockets.connect(self.uri) as websocket:
+                self.outbox = asyncio.Queue()
+                self.key_ready = asyncio.Event()
+                sender = asyncio.create_task(self._send_loop(websocket))
                 self.websocket = websocket
                 self.connected.emit()
 
-                await websocket.send(json.dumps({"type": "ISC", "key": self.public_key}))
+                await websocket.send(self._hello())
 
                 while self.keep_running:
                     try:
                         msg = await websocket.recv()
-                        if isinstance(msg, str):
-                            data = json.loads(msg)
-                            enc_key: int = data["key"]
-                            key = encryption.decrypt_oaep(enc_key, self.private_key)
-                            self.aes_key = key
-                        else:
-                            dec_msg = aes_cbc_decrypt(msg[16:],self.aes_key, msg[:16])
-                            self.message_received.emit(dec_msg.decode())
+                        if not self.key_ready.is_set():
+                            self._accept_session_key(msg)
+                            continue
+                        if self.sequenced and framing.is_control(msg):
+                            self._handle_control(framing.unpack_control(msg))
+                            continue
+                        # One live message, or the backlog replayed as a single frame
+                        with span("receive_frame", "receive"):
+                            received = self._decode_frame(msg)
+                        if received:
+                            if profiling.enabled:
+                                received[0]["_emitted_ns"] = profiling.now()
+                            self.messages_received.emit(received)
                     except websockets.ConnectionClosed:
                         break
 
@@ -75,11 +145,187 @@ class WebSocketClient(QObject):
             if self.keep_running:
                 raise
         finally:
+            if sender is not None:
+                sender.cancel()
+            self.attachments.close()
+            if self.compression_stats["frames"]:
+                print(f"📦 Sent {compression.summary(self.compression_stats)}")
             self.websocket = None
             self.disconnected.emit()
 
+    def _decode_frame(self, msg):
+        """Decrypted, decoded messages of one incoming frame; attachment chunks are handled here"""
+        received = []
+        for seq, data in framing.unpack(msg) if self.sequenced else [(0, msg)]:
+            self.last_seq = max(self.last_seq, seq)
+            if framing.is_attachment(data):
+                self._handle_attachment(data)
+                continue
+            try:
+                with span("aes_cbc_decrypt", "receive"):
+                    dec_msg = aes_cbc_decrypt(data[16:], self.aes_key, data[:16])
+                with span("decompress", "receive"):
+                    dec_msg = compression.decompress(dec_msg)
+            except (ValueError, zlib.error) as e:
+                self.error.emit(f"Failed to decrypt message {seq}: {e}")
+                continue
+            # A coalesced frame carries several messages
+            with span("envelope_decode", "receive"):
+                for item in unpack_batch(dec_msg):
+                    try:
+                        message = envelope.decode(item)
+                        message["room_seq"] = seq
+                        received.append(message)
+                    except (ValueError, KeyError, TypeError) as e:
+                        self.error.emit(f"Failed to parse message: {e}")
+        return received
+
+    def _hello(self):
+        options = {"room": self.room, "seq": True, "since": self.last_seq, "epoch": self.epoch, "updates": True,
+                   "compression": [compression.ALGORITHM], "envelope": [envelope.FORMAT], "batch": True,
+                   "attachments": True}
+        if self.binary_handshake:
+            return handshake_codec.pack_hello(self.public_key, options)
+        return json.dumps({"type": "ISC", "key": self.public_key, **options})
+
+    def _accept_session_key(self, msg):
+        """Unwrap the session key from the server's handshake reply, binary or JSON"""
+        if isinstance(msg, str):
+            data = json.loads(msg)
+            enc_key: int = data["key"]
+        elif not self.binary_handshake:
+            return  # old servers relay the room's frames to clients still in the handshake
+        else:
+            _, enc_key, data = handshake_codec.unpack_reply(msg)
+        # Servers that predate rooms and sequence numbers name neither in the reply
+        self.sequenced = "room" in data or "epoch" in data
+        with span("decrypt_session_key", "handshake"):
+            self.aes_key = encryption.decrypt_oaep(enc_key, self.private_key)
+        self._apply_formats(data)
+        epoch = data.get("epoch")
+        if epoch is not None and epoch != self.epoch:
+            # The server restarted its sequences and replays from 0 (see handler)
+            self.epoch = epoch
+            self.last_seq = 0
+            self.epoch_changed.emit(epoch)
+        self.key_ready.set()
+
+    def _handle_control(self, options):
+        if "ack" in options:
+            self.last_seq = max(self.last_seq, options["ack"])
+            self.sent_acknowledged.emit(options["ack"])
+        else:
+            self._apply_formats(options)
+
+    def _apply_formats(self, options):
+        """Send in the formats every peer in the room can read"""
+        self.compress = options.get("compression") == compression.ALGORITHM
+        self.binary_envelope = options.get("envelope") == envelope.FORMAT
+        self.batching = options.get("batch") is True
+        self.file_transfers = options.get("attachments") is True
+
+    def _seal(self, plaintext: bytes):
+        iv = os.urandom(16)
+        return iv + aes_cbc_encrypt(plaintext, self.aes_key, iv)
+
+    def _unseal(self, data: bytes):
+        return aes_cbc_decrypt(data[16:], self.aes_key, data[:16])
+
+    def _handle_attachment(self, frame):
+        """Write an attachment chunk to disk; chunks of unknown or failed transfers are dropped"""
+        try:
+            result = self.attachments.handle(frame, self.aes_key, self._unseal)
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+        if result is None:
+            return
+
+        event, transfer = result
+        if event == "done":
+            self.attachment_received.emit(transfer.username, transfer.name, transfer.path)
+        else:
+            self.attachment_progress.emit(transfer.name, transfer.received, transfer.size)
+
+    async def _send_file(self, path, username):
+        await self.key_ready.wait()
+        if not self.file_transfers:
+            raise RuntimeError(NO_FILE_TRANSFERS)
+        name = os.path.basename(path)
+        last_percent = -1
+        for frame, sent, total in outgoing_frames(path, username, self.aes_key, self._seal):
+            # send() waits while the socket's write buffer is full: that is the flow control
+            await self.websocket.send(frame)
+            percent = sent * 100 // total if total else 100
+            if percent != last_percent:
+                last_percent = percent
+                self.attachment_progress.emit(name, sent, total)
+
+    async def _send_loop(self, websocket):
+        """Encrypt and send queued messages; those within COALESCE_WINDOW share a frame if the room allows batches"""
+        await self.key_ready.wait()
+        while True:
+            batch = [await self.outbox.get()]
+            deadline = self.loop.time() + COALESCE_WINDOW
+            while len(batch) < MAX_BATCH:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.outbox.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Without batching every message goes out as a frame of its own
+            for messages in [batch] if self.batching else [[message] for message in batch]:
+                await self._send_frame(websocket, messages)
+
+    async def _send_frame(self, websocket, messages):
+        with span("send_frame", "send"):
+            # The flags tell the server which formats a receiver needs to read this frame
+            flags = framing.CHAT_BINARY_ENVELOPE if self.binary_envelope else 0
+            if len(messages) > 1:
+                flags |= framing.CHAT_BATCH
+            with span("envelope_encode", "send"):
+                plaintext = pack_batch([self._encode(username, msg, timestamp)
+                                        for username, msg, timestamp in messages])
+            if self.compress:
+                with span("compress", "send"):
+                    payload = compression.compress(plaintext, self.compression_stats)
+                if payload is not plaintext:
+                    flags |= framing.CHAT_COMPRESSED
+            else:
+                payload = plaintext
+                compression.count(self.compression_stats, plaintext, payload)
+            iv = os.urandom(16)
+            with span("aes_cbc_encrypt", "send"):
+                frame = iv + aes_cbc_encrypt(payload, self.aes_key, iv)
+            if self.sequenced:
+                frame = framing.pack_chat(flags, frame)  # old servers relay frames as they are
+            self.compression_stats["wire_bytes"] += len(frame)
+        with span("websocket_send", "send"):
+            await websocket.send(frame)
+
+    def _encode(self, username, msg, timestamp):
+        if not self.binary_envelope:
+            return envelope.encode_json(username, msg)
+        self.envelope_seq += 1
+        return envelope.encode(username, msg, timestamp, self.envelope_seq)
+
+    def _load_keys(self):
+        if self.key_pool is not None:
+            self.public_key, self.private_key = self.key_pool.take(self.rsa_key_size)
+        else:
+            self.public_key, self.private_key = encryption.generate_keys(self.rsa_key_size,
+                                                                         parallel=self.parallel_keygen)
+
     def _run_event_loop(self):
         """Run asyncio event loop in separate thread"""
+        if self.private_key is None:
+            with span("load_keys", "handshake"):
+                self._load_keys()
+            if not self.keep_running:
+                return
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
         try:
@@ -104,18 +350,31 @@ class WebSocketClient(QObject):
         if self.worker_thread and self.worker_thread.is_alive():
             self.worker_thread.join(timeout=2.0)
 
-    def send_message(self, msg: str):
-        """Send message through WebSocket"""
+    def send_file(self, path, username):
+        """Stream a local file to the room as encrypted attachment chunks; False if it can't be sent"""
+        if not (self.websocket and self.loop and not self.loop.is_closed()):
+            self.error.emit("WebSocket is not connected")
+            return False
+        if self.key_ready.is_set() and not self.file_transfers:
+            self.error.emit(NO_FILE_TRANSFERS)
+            return False
+        future = asyncio.run_coroutine_threadsafe(self._send_file(path, username), self.loop)
+        future.add_done_callback(self._report_failure)
+        return True
+
+    def _report_failure(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            self.error.emit(str(future.exception()))
+
+    def send_message(self, username: str, msg: str):
+        """Queue message for the client loop, which encodes, encrypts and sends it"""
         if (self.websocket and 
             self.loop and 
             not self.loop.is_closed() and
             self.websocket.state == websockets.protocol.State.OPEN):
 
-            iv = os.urandom(16)
-            enc_msg = iv + aes_cbc_encrypt(msg.encode(),self.aes_key, iv)
-            print(enc_msg)
-            asyncio.run_coroutine_threadsafe(self.websocket.send(enc_msg), self.loop)
+            self.loop.call_soon_threadsafe(self.outbox.put_nowait, (username, msg, envelope.now_ms()))
         else:
-            print("⚠️ WebSocket is not connected.")
+            self.error.emit("WebSocket is not connected")
 
 
@@ -0,0 +1,233 @@
+import bisect
+import mmap
+import os
+import struct
+import time
+import zlib
+
+# Record: crc32 of payload, seq, payload length, payload
+RECORD_HEADER = struct.Struct("!IQI")
+# Sparse index entry: seq, byte offset of its record in the segment
+INDEX_ENTRY = struct.Struct("!QQ")
+
+
+def fsync_all(fds):
+    """fsync and close descriptors from SegmentLog.start_sync()"""
+    try:
+        for fd in fds:
+            os.fsync(fd)
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+class SegmentLog:
+    """Append-only log of one room's encrypted frames, split into segment files
+
+    Segments are named after the first sequence number they hold and roll over
+    once they reach segment_size bytes. Every index_interval bytes a (seq, offset)
+    entry goes into the segment's sparse .idx file. Reads mmap the segments and
+    hand out memoryviews, so backfills are not copied through Python.
+    A readonly log only serves reads, e.g. in a worker while another process writes.
+    """
+
+    def __init__(self, directory, segment_size=16 * 1024 * 1024, index_interval=4096,
+                 retention_age=None, retention_bytes=None, readonly=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self.retention_age = retention_age
+        self.retention_bytes = retention_bytes
+        self.readonly = readonly
+
+        self.last_seq = 0
+        self.active = None        # segment file being appended to
+        self.active_index = None
+        self.active_size = 0
+        self.last_indexed = None  # offset of the last indexed record in the active segment
+        self.dirty = False
+
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+            self._recover()
+
+    def _path(self, base, ext):
+        return os.path.join(self.directory, f"{base:020d}{ext}")
+
+    def segments(self):
+        """Base sequence numbers of the segments on disk, oldest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-4]) for name in names if name.endswith(".log"))
+
+    def _recover(self):
+        """Find last_seq, cut a torn tail off the newest segment and rebuild its index"""
+        bases = self.segments()
+        while bases:
+            base = bases[-1]
+            with open(self._path(base, ".log"), "rb") as f:
+                data = f.read()
+
+            offset = 0
+            index = []
+            while offset + RECORD_HEADER.size <= len(data):
+                crc, seq, length = RECORD_HEADER.unpack_from(data, offset)
+                start = offset + RECORD_HEADER.size
+                end = start + length
+                if end > len(data) or zlib.crc32(data[start:end]) != crc:
+                    break
+                if not index or offset - index[-1][1] >= self.index_interval:
+                    index.append((seq, offset))
+                self.last_seq = seq
+                offset = end
+
+            if offset == 0 and len(bases) > 1:
+                # Nothing usable in the newest segment: drop it and look at the previous one
+                self._remove(base)
+                bases.pop()
+                continue
+
+            self.active = open(self._path(base, ".log"), "r+b")
+            self.active.truncate(offset)
+            self.active.seek(offset)
+            self.active_size = offset
+            self.active_index = open(self._path(base, ".idx"), "wb")
+            for entry in index:
+                self.active_index.write(INDEX_ENTRY.pack(*entry))
+            self.last_indexed = index[-1][1] if index else None
+            self.dirty = True
+            self.sync()
+            return
+
+    def _roll(self, seq):
+        self._close_active()
+        self.active = open(self._path(seq, ".log"), "ab")
+        self.active_index = open(self._path(seq, ".idx"), "ab")
+        self.active_size = 0
+        self.last_indexed = None
+
+    def append(self, seq, payload):
+        """Append one frame; it becomes durable at the next sync()"""
+        if self.active is None or self.active_size >= self.segment_size:
+            self._roll(seq)
+
+        if self.last_indexed is None or self.active_size - self.last_indexed >= self.index_interval:
+            self.active_index.write(INDEX_ENTRY.pack(seq, self.active_size))
+            self.last_indexed = self.active_size
+
+        self.active.write(RECORD_HEADER.pack(zlib.crc32(payload), seq, len(payload)))
+        self.active.write(payload)
+        self.active_size += RECORD_HEADER.size + len(payload)
+        self.last_seq = seq
+        self.dirty = True
+
+    def sync(self):
+        """Flush and fsync everything appended since the last sync (one batch)"""
+        fsync_all(self.start_sync())
+
+    def start_sync(self):
+        """Hand buffered appends to the OS; returns descriptors for fsync_all()
+
+        The descriptors are duplicates, so the fsync can run on another thread while
+        appends go on: they stay valid if the segment rolls over meanwhile, and a later
+        append marks the log dirty again.
+        """
+        if not self.dirty:
+            return []
+        fds = []
+        for f in (self.active, self.active_index):
+            f.flush()
+            fds.append(os.dup(f.fileno()))
+        self.dirty = False
+        return fds
+
+    def _offset_for(self, base, seq):
+        """Offset of the last indexed record at or before seq"""
+        try:
+            with open(self._path(base, ".idx"), "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return 0
+        count = len(raw) // INDEX_ENTRY.size
+        seqs = [INDEX_ENTRY.unpack_from(raw, i * INDEX_ENTRY.size)[0] for i in range(count)]
+        i = bisect.bisect_right(seqs, seq) - 1
+        if i < 0:
+            return 0
+        return INDEX_ENTRY.unpack_from(raw, i * INDEX_ENTRY.size)[1]
+
+    def flush(self):
+        """Hand buffered appends to the OS, where other processes' reads see them (no fsync)"""
+        if self.active is not None:
+            self.active.flush()
+            self.active_index.flush()
+
+    def read_since(self, since, limit=None):
+        """(seq, memoryview) for up to limit frames after since, read through mmap"""
+        # Readers map the file, so buffered appends must reach the OS first
+        self.flush()
+
+        bases = self.segments()
+        first = max(bisect.bisect_right(bases, since + 1) - 1, 0)
+        results = []
+        for base in bases[first:]:
+            try:
+                with open(self._path(base, ".log"), "rb") as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        continue
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                continue  # reclaimed by retention meanwhile
+
+            view = memoryview(mapped)
+            offset = self._offset_for(base, since + 1)
+            while offset + RECORD_HEADER.size <= len(view):
+                _, seq, length = RECORD_HEADER.unpack_from(view, offset)
+                start = offset + RECORD_HEADER.size
+                end = start + length
+                if end > len(view):
+                    break  # record still being written
+                if seq > since:
+                    # The slice keeps the mapping alive for as long as it is used
+                    results.append((seq, view[start:end]))
+                    if limit is not None and len(results) >= limit:
+                        return results
+                offset = end
+        return results
+
+    def enforce_retention(self):
+        """Reclaim the oldest sealed segments beyond the age or size limits"""
+        bases = self.segments()[:-1]  # never the active segment
+        if not bases:
+            return
+        sizes = {base: os.path.getsize(self._path(base, ".log")) for base in bases}
+        total = sum(sizes.values()) + self.active_size
+        now = time.time()
+        for base in bases:
+            too_old = (self.retention_age is not None and
+                       now - os.path.getmtime(self._path(base, ".log")) > self.retention_age)
+            too_big = self.retention_bytes is not None and total > self.retention_bytes
+            if not (too_old or too_big):
+                break
+            self._remove(base)
+            total -= sizes[base]
+
+    def _remove(self, base):
+        for ext in (".log", ".idx"):
+            try:
+                os.remove(self._path(base, ext))
+            except FileNotFoundError:
+                pass
+
+    def _close_active(self):
+        if self.active is not None:
+            self.dirty = True
+            self.sync()
+            self.active.close()
+            self.active_index.close()
+            self.active = None
+            self.active_index = None
+
+    def close(self):
+        self._close_active()
@@ -0,0 +1,146 @@
+import asyncio
+import bisect
+
+# Minimal Prometheus text-format metrics. Updating a metric is a plain attribute
+# increment (histograms add a bisect), so instrumentation can stay on under load.
+# Counters and gauges can instead read a value at scrape time through fn, which
+# costs nothing on the hot path.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, fn=None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, self.fn() if self.fn is not None else self.value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)  # the last slot is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{self.name}_bucket{{le="{bound:g}"}}', cumulative
+        yield f'{self.name}_bucket{{le="+Inf"}}', self.count
+        yield f"{self.name}_sum", self.sum
+        yield f"{self.name}_count", self.count
+
+
+class BucketGauge:
+    """Distribution of values read at scrape time, as one cumulative gauge per bucket
+
+    Every scrape starts from zero, so bucket values may go down: they are gauges
+    (name{le="..."}), not histogram buckets, and rate() does not apply.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last slot is +Inf
+
+    def set(self, values):
+        self.counts = [0] * (len(self.buckets) + 1)
+        for value in values:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{self.name}{{le="{bound:g}"}}', cumulative
+        yield f'{self.name}{{le="+Inf"}}', cumulative + self.counts[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []  # called before each scrape, e.g. to fill scrape-time histograms
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, fn=None):
+        return self.add(Counter(name, help, fn))
+
+    def gauge(self, name, help, fn=None):
+        return self.add(Gauge(name, help, fn))
+
+    def histogram(self, name, help, buckets):
+        return self.add(Histogram(name, help, buckets))
+
+    def bucket_gauge(self, name, help, buckets):
+        return self.add(BucketGauge(name, help, buckets))
+
+    def render(self):
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, value in metric.samples():
+                lines.append(f"{name} {value}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+async def serve(registry, host, port):
+    """Serve registry.render() at GET /metrics over plain HTTP/1.0"""
+
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # headers are not needed
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+                status, content_type, body = "200 OK", CONTENT_TYPE, registry.render().encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -1,38 +1,959 @@
+import abc
 import asyncio
+import argparse
+import hashlib
+import hmac
+import multiprocessing
 import os
+import secrets
+import signal
+import struct
+import tempfile
+import time
+import functools
 import websockets
 import json
-from shared import encryption
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from shared import encryption, framing, compression, envelope, handshake_codec
+from message_log import SegmentLog, fsync_all
+import metrics
 
-connected_clients = set()
-aes_key_bytes = os.urandom(16)
+HOST = "0.0.0.0"
+PORT = 6789
 
+connected_clients = set()  # ClientConnection
 
-async def handler(websocket):
-    connected_clients.add(websocket)
+# Rooms: membership index and one session key per room, derived on first join
+DEFAULT_ROOM = "general"
+MAX_ROOM_NAME = 64
+rooms = {}      # room name -> set of ClientConnection
+room_keys = {}  # room name -> AES session key bytes
+
+# Room keys are derived from this secret, so every worker process agrees on them
+session_secret = os.urandom(32)
+
+
+def server_epoch():
+    """Names this run of room sequence numbers; they restart when the secret (and so the epoch) does"""
+    return hmac.new(session_secret, b"epoch", hashlib.sha256).hexdigest()[:16]
+
+
+def room_key(room):
+    if room not in room_keys:
+        digest = hmac.new(session_secret, room.encode(), hashlib.sha256).digest()
+        room_keys[room] = digest[:16]
+    return room_keys[room]
+
+
+def room_name(value):
+    """Room requested in the handshake, falling back to the default room"""
+    if not isinstance(value, str):
+        return DEFAULT_ROOM
+    value = value.strip()
+    if not value or len(value) > MAX_ROOM_NAME:
+        return DEFAULT_ROOM
+    return value
+
+# History: every relayed frame gets a per-room sequence number and lands in a ring buffer
+HISTORY_SIZE = int(os.environ.get("CHAT_HISTORY_SIZE", "500"))
+room_seq = {}      # room name -> last assigned sequence number
+room_history = {}  # room name -> deque of (seq, relayed_frame() bytes)
+
+
+def next_seq(room):
+    room_seq[room] = room_seq.get(room, 0) + 1
+    return room_seq[room]
+
+
+def history_since(room, since):
+    """(seq, frame) entries of room newer than since, from the ring buffer or the log"""
+    history = room_history.get(room) or ()
+    log = None
+    if not (history and history[0][0] <= since + 1):
+        log = existing_room_log(room)
+    if log is None:
+        return [entry for entry in history if entry[0] > since]
+    # Older than the ring buffer reaches: serve it from the mmap'd segments
+    entries = log.read_since(since, MAX_BACKFILL)
+    if len(entries) < MAX_BACKFILL:
+        # A worker reads the supervisor's log, whose newest frames may still sit in its
+        # write buffer until the next sync; the ring has those
+        last = entries[-1][0] if entries else since
+        entries += [entry for entry in history if entry[0] > last]
+    return entries
+
+# Optional durable history: frames are appended to one SegmentLog per room under LOG_DIR.
+# Only one process writes (the single server, or the supervisor in multi-worker mode).
+LOG_DIR = os.environ.get("CHAT_LOG_DIR") or None
+LOG_SEGMENT_SIZE = int(os.environ.get("CHAT_LOG_SEGMENT_SIZE", str(16 * 1024 * 1024)))
+LOG_FSYNC_INTERVAL = float(os.environ.get("CHAT_LOG_FSYNC_INTERVAL", "0.2"))
+LOG_RETENTION_AGE = float(os.environ.get("CHAT_LOG_RETENTION_AGE", "0")) or None        # seconds
+LOG_RETENTION_BYTES = int(os.environ.get("CHAT_LOG_RETENTION_BYTES", "0")) or None      # per room
+LOG_RETENTION_CHECK = 60  # seconds between retention passes
+MAX_BACKFILL = int(os.environ.get("CHAT_MAX_BACKFILL", "10000"))
+room_logs = {}      # room name -> SegmentLog
+log_writer = False  # True in the process that appends to the logs
+log_tasks = set()
+unflushed_logs = set()  # SegmentLogs the hub appended to this loop tick
+
+
+def room_log(room):
+    log = room_logs.get(room)
+    if log is None:
+        log = room_logs[room] = SegmentLog(os.path.join(LOG_DIR, room.encode().hex()),
+                                           segment_size=LOG_SEGMENT_SIZE,
+                                           retention_age=LOG_RETENTION_AGE,
+                                           retention_bytes=LOG_RETENTION_BYTES,
+                                           readonly=not log_writer)
+    return log
+
+
+def existing_room_log(room):
+    """room's log if history is logged and the room has one on disk, else None
+
+    Catch-up asks for rooms by any name, so this never creates a log directory.
+    """
+    if LOG_DIR is None:
+        return None
+    if room not in room_logs and not os.path.isdir(os.path.join(LOG_DIR, room.encode().hex())):
+        return None
+    return room_log(room)
+
+
+def log_frame(room, seq, message):
+    if log_writer:
+        room_log(room).append(seq, message)
+
+
+def share_logged_frame(room):
+    """Flush room's log to the OS before the hub's frames reach the workers, once per loop tick
+
+    Workers serve old catch-ups from the supervisor's files, so a frame a worker has
+    received must already be readable there.
+    """
+    if not unflushed_logs:
+        # Runs before the bus links' writers, which the frames just queued will wake
+        asyncio.get_running_loop().call_soon(flush_logs)
+    unflushed_logs.add(room_log(room))
+
+
+def flush_logs():
+    for log in unflushed_logs:
+        log.flush()
+    unflushed_logs.clear()
+
+
+def enforce_retention(logs):
+    for log in logs:
+        log.enforce_retention()
+
+
+async def maintain_logs():
+    """Batch fsyncs every LOG_FSYNC_INTERVAL and reclaim old segments now and then
+
+    The fsyncs and segment removals run on a thread, so broadcasts don't wait on the disk.
+    """
+    loop = asyncio.get_running_loop()
+    last_retention = time.monotonic()
+    while True:
+        await asyncio.sleep(LOG_FSYNC_INTERVAL)
+        fds = [fd for log in room_logs.values() for fd in log.start_sync()]
+        if fds:
+            await loop.run_in_executor(None, fsync_all, fds)
+        if time.monotonic() - last_retention >= LOG_RETENTION_CHECK:
+            last_retention = time.monotonic()
+            await loop.run_in_executor(None, enforce_retention, list(room_logs.values()))
+
+
+def load_session_secret():
+    """Keep the room-key secret next to the log, so logged frames stay readable after a restart"""
+    global session_secret
+    path = os.path.join(LOG_DIR, "session.key")
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, "rb") as f:
+            session_secret = f.read()
+    else:
+        with os.fdopen(fd, "wb") as f:
+            f.write(session_secret)
+    room_keys.clear()
+
+
+def start_log_writer():
+    """Open the logs for writing and continue every room's sequence where its log ends"""
+    global log_writer
+    if LOG_DIR is None:
+        return
+    log_writer = True
+    os.makedirs(LOG_DIR, mode=0o700, exist_ok=True)
+    load_session_secret()
+    for name in os.listdir(LOG_DIR):
+        if not os.path.isdir(os.path.join(LOG_DIR, name)):
+            continue
+        try:
+            room = bytes.fromhex(name).decode()
+        except ValueError:
+            continue  # not a room log (room directories are named by the hex of the room name)
+        room_seq[room] = room_log(room).last_seq
+    task = asyncio.get_running_loop().create_task(maintain_logs())
+    log_tasks.add(task)
+    print(f"✅ Logging history to {LOG_DIR}")
+
+# Broadcast fan-out: each client gets a bounded outbound queue drained by its own writer
+OUTBOUND_QUEUE_SIZE = int(os.environ.get("CHAT_OUTBOUND_QUEUE_SIZE", "256"))
+SLOW_CONSUMER_POLICY = os.environ.get("CHAT_SLOW_CONSUMER_POLICY", "drop_oldest")  # or "disconnect"
+fanout_stats = {"dropped_frames": 0, "slow_disconnects": 0}
+close_tasks = set()  # slow-consumer closes in flight; the loop only holds tasks weakly
+
+# Attachment chunks are flow-controlled instead: the sender waits while receivers are backed up
+ATTACHMENT_HIGH_WATER = OUTBOUND_QUEUE_SIZE // 2
+ATTACHMENT_STALL_TIMEOUT = float(os.environ.get("CHAT_ATTACHMENT_STALL_TIMEOUT", "10"))
+
+# Payload formats: compression, binary envelopes and multi-message batches. The server never
+# sees the plaintext, so a room only gets a format every member offered. Clients that take
+# updates (sequenced ones offering "updates") hear through a control frame whenever their
+# room's set changes, e.g. up- or downgraded as an older client leaves or joins. Frames
+# already in flight at that moment keep the format they were sent in; their cleartext
+# flags (framing.pack_chat) keep them from members that can't read it. Clients that
+# don't take updates offer nothing and are granted nothing.
+COMPRESSION_ENABLED = os.environ.get("CHAT_COMPRESSION", "1") != "0"
+BINARY_ENVELOPE_ENABLED = os.environ.get("CHAT_BINARY_ENVELOPE", "1") != "0"
+BATCH_FORMAT = "batch"
+ATTACHMENT_FORMAT = "attachments"  # file transfers (framing.pack_attachment frames)
+ALL_FORMATS = frozenset({compression.ALGORITHM, envelope.FORMAT, BATCH_FORMAT, ATTACHMENT_FORMAT})
+ATTACHMENT_NEEDS = frozenset({ATTACHMENT_FORMAT})
+FLAG_FORMATS = {framing.CHAT_COMPRESSED: compression.ALGORITHM,
+                framing.CHAT_BINARY_ENVELOPE: envelope.FORMAT,
+                framing.CHAT_BATCH: BATCH_FORMAT}
+# Formats a receiver needs for a chat frame, by its flags byte
+FORMATS_BY_FLAGS = [frozenset(name for flag, name in FLAG_FORMATS.items() if flags & flag)
+                    for flags in range(framing.CHAT_FLAGS + 1)]
+remote_formats = {}  # room name -> formats every other worker's members offered (multi-worker mode)
+published_formats = {}  # room name -> local formats last reported to the hub
+
+
+def offered_formats(data):
+    """Formats a hello offers that this server allows"""
+    if data.get("updates") is not True or not data.get("seq"):
+        return frozenset()  # can't be told to downgrade later, so it never gets anything
+    formats = set()
+    if COMPRESSION_ENABLED and compression.ALGORITHM in (data.get("compression") or []):
+        formats.add(compression.ALGORITHM)
+    if BINARY_ENVELOPE_ENABLED and envelope.FORMAT in (data.get("envelope") or []):
+        formats.add(envelope.FORMAT)
+    if data.get("batch") is True:
+        formats.add(BATCH_FORMAT)
+    if data.get("attachments") is True:
+        formats.add(ATTACHMENT_FORMAT)
+    return frozenset(formats)
+
+
+def local_formats(room):
+    formats = ALL_FORMATS
+    for member in rooms.get(room, ()):
+        formats &= member.offers
+    return formats
+
+
+def room_formats(room, joining=ALL_FORMATS):
+    """Formats every member of room can read, counting a client about to join"""
+    return local_formats(room) & remote_formats.get(room, ALL_FORMATS) & joining
+
+
+def format_options(formats):
+    """Handshake reply / control frame fields for a format set"""
+    return {"compression": compression.ALGORITHM if compression.ALGORITHM in formats else None,
+            "envelope": envelope.FORMAT if envelope.FORMAT in formats else None,
+            "batch": BATCH_FORMAT in formats,
+            "attachments": ATTACHMENT_FORMAT in formats}
+
+
+def update_room_formats(room):
+    """Tell members whose granted formats no longer match the room's"""
+    formats = room_formats(room)
+    control = None
+    for member in rooms.get(room, ()):
+        if member.granted != formats:
+            if control is None:
+                control = framing.pack_control(format_options(formats))
+            member.granted = formats
+            member.enqueue(control)
+    if bus_writer is not None:
+        local = local_formats(room) if room in rooms else None
+        if published_formats.get(room) != local:
+            published_formats[room] = local
+            bus_publish_formats(room, local)
+
+# Handshake admission control
+MAX_CONCURRENT_HANDSHAKES = int(os.environ.get("CHAT_MAX_HANDSHAKES", "128"))
+MAX_PENDING_JOINS = int(os.environ.get("CHAT_MAX_PENDING_JOINS", "256"))
+HANDSHAKE_TIMEOUT = float(os.environ.get("CHAT_HANDSHAKE_TIMEOUT", "10"))
+MIN_KEY_BITS = 8 * (2 * encryption.HASH_LEN + 2 + 16)  # OAEP needs this much room for a 16-byte key
+MAX_KEY_BITS = 8192
+
+handshake_slots = None  # asyncio.Semaphore, created on the server's loop
+handshake_stats = {
+    "pending": 0,        # joins waiting for a handshake slot
+    "in_progress": 0,
+    "completed": 0,
+    "rejected": 0,       # pending-join queue was full
+    "timed_out": 0,
+    "invalid": 0,        # malformed hello or unusable public key
+}
+
+# Metrics, served in Prometheus text format on METRICS_PORT (workers use METRICS_PORT + index).
+# Hot-path updates are plain increments; CHAT_METRICS=0 turns the timed ones off.
+METRICS_ENABLED = os.environ.get("CHAT_METRICS", "1") != "0"
+METRICS_PORT = int(os.environ.get("CHAT_METRICS_PORT", "0")) or None
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUEUE_DEPTH_BUCKETS = (0, 1, 4, 16, 64, 128, 256, 1024)
+
+registry = metrics.Registry()
+registry.gauge("chat_connected_clients", "Clients past the handshake", lambda: len(connected_clients))
+registry.gauge("chat_rooms", "Rooms with at least one local member", lambda: len(rooms))
+registry.counter("chat_handshakes_total", "Completed handshakes", lambda: handshake_stats["completed"])
+registry.counter("chat_handshakes_rejected_total", "Joins turned away because the pending queue was full",
+                 lambda: handshake_stats["rejected"])
+registry.counter("chat_handshakes_timed_out_total", "Handshakes that ran out of time",
+                 lambda: handshake_stats["timed_out"])
+registry.counter("chat_handshakes_invalid_total", "Joins with a malformed hello or unusable public key",
+                 lambda: handshake_stats["invalid"])
+registry.gauge("chat_handshakes_pending", "Joins waiting for a handshake slot", lambda: handshake_stats["pending"])
+registry.gauge("chat_handshakes_in_progress", "Handshakes running", lambda: handshake_stats["in_progress"])
+handshake_seconds = registry.histogram("chat_handshake_duration_seconds",
+                                       "Time from accepting a join to sending the session key", LATENCY_BUCKETS)
+relayed_messages = registry.counter("chat_messages_relayed_total", "Frames delivered to a room")
+relayed_bytes = registry.counter("chat_bytes_relayed_total", "Frame bytes queued to receivers")
+fanout_seconds = registry.histogram("chat_broadcast_fanout_seconds",
+                                    "Time to queue one frame to every local member of its room", LATENCY_BUCKETS)
+registry.counter("chat_dropped_frames_total", "Frames dropped from full outbound queues",
+                 lambda: fanout_stats["dropped_frames"])
+registry.counter("chat_slow_disconnects_total", "Clients disconnected for falling behind",
+                 lambda: fanout_stats["slow_disconnects"])
+queue_depth = registry.bucket_gauge("chat_client_queue_depth",
+                                    "Clients whose outbound queue depth is at most le, at scrape time",
+                                    QUEUE_DEPTH_BUCKETS)
+queue_depth_max = registry.gauge("chat_client_queue_depth_max", "Deepest client outbound queue at scrape time")
+
+
+def collect_queue_depths():
+    # Read at scrape time rather than tracked per enqueue; a few bucket series instead of one per client
+    depths = [client.queue.qsize() for client in connected_clients]
+    queue_depth.set(depths)
+    queue_depth_max.set(max(depths, default=0))
+
+
+registry.collectors.append(collect_queue_depths)
+
+
+async def start_metrics(port):
+    if port is None:
+        return
+    await metrics.serve(registry, HOST, port)
+    print(f"📈 Metrics on http://{HOST}:{port}/metrics")
+
+# Joins that arrive within one loop tick are wrapped as a single batch. Batches at least
+# HANDSHAKE_POOL_THRESHOLD big are spread over a process pool; a batch never holds more
+# than MAX_CONCURRENT_HANDSHAKES joins, so the threshold is capped at that.
+HANDSHAKE_POOL_THRESHOLD = min(int(os.environ.get("CHAT_HANDSHAKE_POOL_THRESHOLD", "64")),
+                               MAX_CONCURRENT_HANDSHAKES)
+MAX_HELLO_SIZE = 64 * 1024  # a hello is well under 2 KiB even with a 8192-bit key
+pending_handshakes = []
+handshake_pool = None
+flush_tasks = set()
+
+
+async def flush_handshakes():
+    global handshake_pool
+    batch = pending_handshakes[:]
+    pending_handshakes.clear()
+
+    executor = None
+    if len(batch) >= HANDSHAKE_POOL_THRESHOLD:
+        if handshake_pool is None:
+            handshake_pool = ProcessPoolExecutor()
+        executor = handshake_pool
+
+    # Each room has its own session key, so wrap one sub-batch per room
+    by_room = {}
+    for pub_key, room, future in batch:
+        by_room.setdefault(room, []).append((pub_key, future))
+
+    for room, entries in by_room.items():
+        # RSA work runs off the event loop so broadcasts keep flowing
+        encrypt = functools.partial(encryption.encrypt_oaep_batch, room_key(room),
+                                    [key for key, _ in entries], executor=executor)
+        try:
+            ciphertexts = await asyncio.get_running_loop().run_in_executor(None, encrypt)
+        except Exception as e:
+            for _, future in entries:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        for (_, future), ciphertext in zip(entries, ciphertexts):
+            if future.done():
+                continue
+            if isinstance(ciphertext, Exception):
+                future.set_exception(ciphertext)  # only this join fails
+            else:
+                future.set_result(ciphertext)
+
+
+def wrap_session_key(pub_key, room=DEFAULT_ROOM):
+    """Queue pub_key for the next batch; resolves to the OAEP-wrapped session key of room"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    pending_handshakes.append((pub_key, room, future))
+    if len(pending_handshakes) == 1:
+        # The task first runs on the next loop iteration, after this tick's joins queued up
+        task = loop.create_task(flush_handshakes())
+        flush_tasks.add(task)
+        task.add_done_callback(flush_tasks.discard)
+    return future
+
+
+def valid_public_key(key):
+    """Whether key is an (e, n) pair the session key can be wrapped for"""
+    if not isinstance(key, (list, tuple)) or len(key) != 2:
+        return False
+    e, n = key
+    if type(e) is not int or type(n) is not int:
+        return False
+    return MIN_KEY_BITS <= n.bit_length() <= MAX_KEY_BITS and n % 2 == 1 and 3 <= e < n
+
+
+async def handshake(websocket):
+    """(room, handshake data, offered formats, granted formats), or None if the hello was malformed"""
     init_msg = await websocket.recv()
-    data = json.loads(init_msg);
+    try:
+        if len(init_msg) > MAX_HELLO_SIZE:
+            raise ValueError("Hello too large")
+        if isinstance(init_msg, bytes):
+            # Binary hello: the key arrives as raw big-endian bytes, nothing to parse off-loop
+            version, pub_key, data = handshake_codec.unpack_hello(init_msg)
+            version = min(version, handshake_codec.VERSION)
+        else:
+            version = None  # legacy JSON handshake
+            # Parsed in-line: awaiting an executor would spread joins that arrived
+            # together over several ticks and shrink their batch
+            data = json.loads(init_msg)
+            pub_key = data.get("key") if isinstance(data, dict) else None
+    except (ValueError, struct.error):
+        pub_key = data = None
+    # Checked before the key joins a batch, where it would cost RSA work for nothing
+    if not isinstance(data, dict) or not valid_public_key(pub_key):
+        handshake_stats["invalid"] += 1
+        await websocket.close(code=1008, reason="Invalid handshake")
+        return None
+
+    room = room_name(data.get("room"))
+    encrypted_aes = await wrap_session_key(pub_key, room)
+    offers = offered_formats(data)
+    granted = room_formats(room, offers)  # corrected by a control frame if the room changes before joining
+    reply = {"room": room, "epoch": server_epoch(), **format_options(granted)}
+
+    if version is None:
+        await websocket.send(json.dumps({"type": "ISC", "key": encrypted_aes, **reply}))
+    else:
+        await websocket.send(handshake_codec.pack_reply(encrypted_aes, pub_key[1], reply, version))
+    return room, data, offers, granted
+
 
-    pub_key = data.get("key")
-    encrypted_aes = encryption.encrypt_oaep(aes_key_bytes, pub_key)
-    await websocket.send(json.dumps({"type": "ISC", "key": encrypted_aes}))
+async def admit(websocket):
+    """Run the handshake under the concurrency limit; handshake()'s result, or None if turned away"""
+    global handshake_slots
+    if handshake_slots is None:
+        handshake_slots = asyncio.Semaphore(MAX_CONCURRENT_HANDSHAKES)
+
+    if handshake_stats["pending"] >= MAX_PENDING_JOINS:
+        handshake_stats["rejected"] += 1
+        await websocket.close(code=1013, reason="Server busy, try again later")
+        return None
+
+    start = time.perf_counter()
+    handshake_stats["pending"] += 1
+    waiting = True
+    try:
+        async with handshake_slots:
+            handshake_stats["pending"] -= 1
+            waiting = False
+            handshake_stats["in_progress"] += 1
+            try:
+                # Budget covers the wait for a slot too, so half-open sockets can't linger
+                remaining = HANDSHAKE_TIMEOUT - (time.perf_counter() - start)
+                joined = await asyncio.wait_for(handshake(websocket), max(remaining, 0))
+            finally:
+                handshake_stats["in_progress"] -= 1
+    except asyncio.TimeoutError:
+        handshake_stats["timed_out"] += 1
+        await websocket.close(code=1008, reason="Handshake timed out")
+        return None
+    finally:
+        if waiting:
+            handshake_stats["pending"] -= 1
+    if joined is None:
+        return None
+
+    elapsed = time.perf_counter() - start
+    handshake_stats["completed"] += 1
+    handshake_seconds.observe(elapsed)
+    return joined
+
+
+class OutboundQueue(abc.ABC):
+    """Queue of outgoing frames drained by its own writer task; subclasses decide what a full queue does"""
+
+    closed_errors = (websockets.ConnectionClosed, ConnectionError)
+
+    def __init__(self, maxsize=0):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.closing = False
+        self.writer = asyncio.get_running_loop().create_task(self.drain())
+
+    @abc.abstractmethod
+    async def send(self, frame):
+        """Write one frame to the receiver"""
+
+    def enqueue(self, frame):
+        """Queue a frame without waiting"""
+        if not self.closing:
+            self.queue.put_nowait(frame)
+
+    async def drain(self):
+        try:
+            while True:
+                frame = await self.queue.get()
+                await self.send(frame)
+        except self.closed_errors:
+            pass
+
+    def stop(self):
+        self.closing = True
+        self.writer.cancel()
+
+
+class ClientConnection(OutboundQueue):
+    """A connected client with its own outbound queue and writer task
+
+    A full queue applies SLOW_CONSUMER_POLICY: the oldest frame is dropped, or the
+    client is disconnected.
+    """
+
+    def __init__(self, websocket, room=DEFAULT_ROOM, sequenced=False, updates=False,
+                 offers=frozenset(), granted=frozenset()):
+        super().__init__(OUTBOUND_QUEUE_SIZE)
+        self.websocket = websocket
+        self.room = room
+        self.sequenced = sequenced  # wants framing.pack_message frames with sequence numbers
+        self.updates = updates  # takes control frames: format changes and acks of its own frames
+        self.offers = offers    # payload formats this client can read
+        self.granted = granted  # formats it was last told its room uses
+        self.id = secrets.randbits(63)  # identifies the sender across workers
+        self.dropped = 0
+
+    def enqueue(self, frame):
+        """Queue a frame without waiting; applies the slow-consumer policy when full"""
+        if self.closing:
+            return
+        if self.queue.full():
+            if SLOW_CONSUMER_POLICY == "disconnect":
+                self.closing = True
+                fanout_stats["slow_disconnects"] += 1
+                task = asyncio.get_running_loop().create_task(self.close_slow())
+                close_tasks.add(task)
+                task.add_done_callback(close_tasks.discard)
+                return
+            # drop_oldest
+            self.queue.get_nowait()
+            self.dropped += 1
+            fanout_stats["dropped_frames"] += 1
+        self.queue.put_nowait(frame)
+
+    async def send(self, frame):
+        await self.websocket.send(frame)
+
+    async def close_slow(self):
+        await self.websocket.close(code=1008, reason="Client too slow")
+
+
+def relayed_frame(sender, message):
+    """A client's frame as the server keeps and relays it, or None to drop it
+
+    Chat frames are framing.pack_chat frames (the flags byte is added for clients
+    that don't send one); attachment frames stay as they are.
+    """
+    if isinstance(message, str):
+        message = message.encode()
+    if not sender.updates:
+        return framing.pack_chat(0, message)
+    if framing.is_attachment(message):
+        return message
+    if not message or message[0] & ~framing.CHAT_FLAGS:
+        return None
+    return message
+
+
+def readable_entries(client, entries):
+    """Backlog entries client can read, without their flags byte"""
+    return [(seq, data[1:]) for seq, data in entries if FORMATS_BY_FLAGS[data[0]] <= client.offers]
+
+
+def broadcast(sender, message):
+    """Relay a frame to the other members of the sender's room; never waits on a receiver"""
+    if bus_writer is not None:
+        # The hub assigns the sequence number and echoes the frame back to every worker
+        bus_publish(sender.room, message, sender.id)
+        return
+    deliver(sender.room, next_seq(sender.room), message, sender.id)
+
+
+def deliver(room, seq, message, sender_id):
+    """Record frame seq of room in the history and hand it to the local members that can read it"""
+    # Attachment chunks are streamed live only; they would crowd chat out of the history
+    if framing.is_attachment(message):
+        data = message
+        needs = ATTACHMENT_NEEDS
+    else:
+        data = message[1:]  # receivers get the sealed frame without its flags
+        needs = FORMATS_BY_FLAGS[message[0]]
+        history = room_history.get(room)
+        if history is None:
+            history = room_history[room] = deque(maxlen=HISTORY_SIZE)
+        history.append((seq, message))
+        if bus_writer is None:
+            log_frame(room, seq, message)
+
+    if METRICS_ENABLED:
+        start = time.perf_counter()
+    sequenced_frame = None
+    members = rooms.get(room, ())
+    receivers = len(members)
+    for client in members:
+        if client.id == sender_id:
+            receivers -= 1
+            if client.updates:
+                # The sender learns the seq of its own frame, so a catch-up won't replay it
+                client.enqueue(framing.pack_control({"ack": seq}))
+            continue
+        if not needs <= client.offers:
+            receivers -= 1  # sent before the room was downgraded for this client, or a file it can't take
+            continue
+        if client.sequenced:
+            # Encoded once per message, shared by every sequenced receiver
+            if sequenced_frame is None:
+                sequenced_frame = framing.pack_message(seq, data)
+            client.enqueue(sequenced_frame)
+        else:
+            client.enqueue(data)
+
+    relayed_messages.inc()
+    relayed_bytes.inc(receivers * len(data))
+    if METRICS_ENABLED:
+        fanout_seconds.observe(time.perf_counter() - start)
+
+
+# Multi-worker mode: workers relay broadcasts through a hub on a Unix socket, which
+# sequences them per room and sends them to every worker (the origin included).
+# Bus frame: kind, room length, payload length, seq, sender id, room, payload
+BUS_HEADER = struct.Struct("!BHIQQ")
+BUS_MESSAGE = 0
+BUS_FORMATS = 1  # payload: JSON list of a room's formats, null when a worker has no members there
+BUS_QUEUE_SIZE = int(os.environ.get("CHAT_BUS_QUEUE_SIZE", "4096"))  # frames per worker before the hub pushes back
+bus_writer = None  # StreamWriter to the hub; only set in worker processes
+
+
+def pack_bus_frame(room, payload, seq, sender_id, kind=BUS_MESSAGE):
+    room_bytes = room.encode()
+    return BUS_HEADER.pack(kind, len(room_bytes), len(payload), seq, sender_id) + room_bytes + payload
+
+
+def pack_formats(formats):
+    return json.dumps(sorted(formats) if formats is not None else None).encode()
+
+
+def unpack_formats(payload):
+    formats = json.loads(payload)
+    return frozenset(formats) if formats is not None else None
+
+
+def bus_publish(room, message, sender_id):
+    bus_writer.write(pack_bus_frame(room, message, 0, sender_id))
+
+
+def bus_publish_formats(room, formats):
+    """Report the formats of this worker's members of room, None once it has none"""
+    bus_writer.write(pack_bus_frame(room, pack_formats(formats), 0, 0, BUS_FORMATS))
+
+
+class BusLink(OutboundQueue):
+    """The hub's connection to one worker
+
+    Bus frames are never dropped and a slow worker is never cut off: losing chat frames
+    or a BUS_FORMATS update would leave rooms out of step, and a worker without its bus
+    exits (which stops the whole server). Instead the hub stops reading new broadcasts
+    while any worker has BUS_QUEUE_SIZE frames waiting, which pushes back through each
+    worker's bus_writer.drain() to its clients' sockets.
+    """
+
+    def __init__(self, writer):
+        super().__init__()
+        self.stream = writer
+        self.formats = {}  # room name -> formats of the worker's members there
+
+    async def send(self, frame):
+        self.stream.write(frame)
+        await self.stream.drain()
+
+    async def wait_for_capacity(self):
+        while self.queue.qsize() >= BUS_QUEUE_SIZE and not self.closing:
+            await asyncio.sleep(0.01)
+
+
+async def read_bus_frame(reader):
+    """One bus frame as (kind, room, payload, seq, sender id)"""
+    header = await reader.readexactly(BUS_HEADER.size)
+    kind, room_len, payload_len, seq, sender_id = BUS_HEADER.unpack(header)
+    body = await reader.readexactly(room_len + payload_len)
+    return kind, body[:room_len].decode(), body[room_len:], seq, sender_id
+
+
+async def bus_listen(reader):
+    """Deliver sequenced broadcasts from the hub to this worker's room members"""
+    try:
+        while True:
+            kind, room, payload, seq, sender_id = await read_bus_frame(reader)
+            if kind == BUS_FORMATS:
+                # What the whole room can read, this worker's members included
+                remote_formats[room] = unpack_formats(payload)
+                update_room_formats(room)
+                continue
+            deliver(room, seq, payload, sender_id)
+    except asyncio.IncompleteReadError:
+        print("⚠️ Lost connection to the worker bus")
+
+
+async def run_bus_hub(path):
+    """Master side of the bus: sequence every frame and forward it to all workers
+
+    It also combines the rooms' formats reported by each worker and sends every
+    worker the set the whole room can read whenever that changes.
+    """
+    workers = set()
+    sent_formats = {}  # room name -> combined formats last sent to the workers
+
+    def combine_formats(room):
+        formats = ALL_FORMATS
+        for worker in workers:
+            if room in worker.formats:
+                formats &= worker.formats[room]
+        if sent_formats.get(room) != formats:
+            sent_formats[room] = formats
+            frame = pack_bus_frame(room, pack_formats(formats), 0, 0, BUS_FORMATS)
+            for worker in workers:
+                worker.enqueue(frame)
+
+    async def relay(reader, writer):
+        link = BusLink(writer)
+        workers.add(link)
+        try:
+            while True:
+                kind, room, payload, _, sender_id = await read_bus_frame(reader)
+                if kind == BUS_FORMATS:
+                    formats = unpack_formats(payload)
+                    if formats is None:
+                        link.formats.pop(room, None)
+                    else:
+                        link.formats[room] = formats
+                    combine_formats(room)
+                    continue
+                seq = next_seq(room)
+                if log_writer and not framing.is_attachment(payload):
+                    log_frame(room, seq, payload)
+                    share_logged_frame(room)
+                frame = pack_bus_frame(room, payload, seq, sender_id)
+                for worker in workers:
+                    worker.enqueue(frame)
+                for worker in list(workers):
+                    await worker.wait_for_capacity()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Cancelled at shutdown; swallowed so asyncio does not log the stream callback
+            pass
+        finally:
+            workers.discard(link)
+            link.stop()
+            writer.close()
+            for room in link.formats:
+                combine_formats(room)
+
+    return await asyncio.start_unix_server(relay, path=path)
+
+
+async def wait_for_room_capacity(sender):
+    """Hold an attachment sender back until the room's local outbound queues drain"""
+    deadline = time.monotonic() + ATTACHMENT_STALL_TIMEOUT
+    while time.monotonic() < deadline and any(
+            client.queue.qsize() >= ATTACHMENT_HIGH_WATER
+            for client in rooms.get(sender.room, ()) if client is not sender):
+        await asyncio.sleep(0.01)
+
+
+def join_room(client):
+    rooms.setdefault(client.room, set()).add(client)
+    connected_clients.add(client)
+    update_room_formats(client.room)
+
+
+def leave_room(client):
+    connected_clients.discard(client)
+    members = rooms.get(client.room)
+    if members is not None:
+        members.discard(client)
+        if not members:
+            # The key stays: a handshake for this room may already hold it
+            del rooms[client.room]
+        update_room_formats(client.room)
+
+
+async def handler(websocket):
+    try:
+        joined = await admit(websocket)
+    except websockets.exceptions.ConnectionClosed:
+        return
+    if joined is None:
+        return
+    room, data, offers, granted = joined
+    sequenced = bool(data.get("seq"))
+    client = ClientConnection(websocket, room, sequenced=sequenced, updates=sequenced and data.get("updates") is True,
+                              offers=offers, granted=granted)
+
+    # Catch-up and joining happen in one step, so no frame falls between backlog and live
+    since = data.get("since")
+    if "epoch" in data and data["epoch"] != server_epoch():
+        since = 0  # its last_seq counts from an earlier run of the room sequences
+    if client.sequenced and isinstance(since, int):
+        backlog = history_since(room, since)
+        try:
+            # A gap longer than one backfill is paged straight to the socket until the
+            # rest fits one page, so the bounded queue drops none of it
+            while len(backlog) >= MAX_BACKFILL:
+                for frame in framing.pack_replay(readable_entries(client, backlog)):
+                    await websocket.send(frame)
+                backlog = history_since(room, backlog[-1][0])
+        except websockets.exceptions.ConnectionClosed:
+            client.stop()
+            return
+        for frame in framing.pack_replay(readable_entries(client, backlog)):
+            client.enqueue(frame)
+    join_room(client)
 
     try:
         async for message in websocket:
+            message = relayed_frame(client, message)
+            if message is None:
+                continue
+            if framing.is_attachment(message):
+                # Not reading further from this socket pushes back on the sender via TCP
+                await wait_for_room_capacity(client)
             # Broadcast incoming message to all connected clients
-            await asyncio.gather(*[
-                client.send(message) for client in connected_clients
-                if client != websocket
-            ])
+            broadcast(client, message)
+            if bus_writer is not None:
+                # Stop reading from this client while the hub is not keeping up
+                await bus_writer.drain()
     except websockets.exceptions.ConnectionClosed:
         pass
     finally:
-        connected_clients.remove(websocket)
+        leave_room(client)
+        client.stop()
 
-async def main():
-    async with websockets.serve(handler, "0.0.0.0", 6789):
-        print("✅ WebSocket server running on ws://0.0.0.0:6789")
+async def main(reuse_port=False, metrics_port=None):
+    if bus_writer is None:
+        start_log_writer()
+    await start_metrics(metrics_port)
+    async with websockets.serve(handler, HOST, PORT, reuse_port=reuse_port):
+        print(f"✅ WebSocket server running on ws://{HOST}:{PORT} (pid {os.getpid()})")
         await asyncio.Future()  # run forever
 
+
+async def worker_main(bus_path, metrics_port):
+    global bus_writer
+    reader, bus_writer = await asyncio.open_unix_connection(bus_path)
+    listener = asyncio.create_task(bus_listen(reader))
+    server = asyncio.create_task(main(reuse_port=True, metrics_port=metrics_port))
+    # Losing the bus (the supervisor went away) ends the worker too
+    await asyncio.wait([listener, server], return_when=asyncio.FIRST_COMPLETED)
+    listener.cancel()
+    server.cancel()
+
+
+def run_worker(bus_path, secret, port, log_dir, metrics_port):
+    global session_secret, PORT, LOG_DIR
+    session_secret = secret
+    PORT = port
+    LOG_DIR = log_dir
+    asyncio.run(worker_main(bus_path, metrics_port))
+
+
+async def supervise(workers):
+    """Start the bus hub and workers processes sharing the port via SO_REUSEPORT"""
+    bus_path = os.path.join(tempfile.mkdtemp(prefix="rsa-chat-"), "bus.sock")
+    hub = await run_bus_hub(bus_path)
+    start_log_writer()
+
+    # spawn, not fork: children must not inherit this running event loop
+    context = multiprocessing.get_context("spawn")
+    # Each worker keeps its own metrics, so each gets its own metrics port
+    procs = [context.Process(target=run_worker,
+                             args=(bus_path, session_secret, PORT, LOG_DIR,
+                                   METRICS_PORT + index if METRICS_PORT else None))
+             for index in range(workers)]
+    for proc in procs:
+        proc.start()
+    print(f"✅ Started {workers} workers on port {PORT}, bus at {bus_path}")
+
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+
+    try:
+        while not stop.is_set():
+            if not all(proc.is_alive() for proc in procs):
+                print("❌ A worker exited, shutting down")
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.join()
+        hub.close()
+        for log in room_logs.values():
+            log.close()
+        os.unlink(bus_path)
+        os.rmdir(os.path.dirname(bus_path))
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="RSA chat server")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes sharing the port (needs SO_REUSEPORT and Unix sockets)")
+    parser.add_argument("--log-dir", default=LOG_DIR,
+                        help="directory for the durable message log (default: CHAT_LOG_DIR, off if unset)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve Prometheus metrics on this port, workers on consecutive ports "
+                             "(default: CHAT_METRICS_PORT, off if unset)")
+    args = parser.parse_args()
+    PORT = args.port
+    LOG_DIR = args.log_dir
+    METRICS_PORT = args.metrics_port
+
+    if args.workers > 1:
+        asyncio.run(supervise(args.workers))
+    else:
+        asyncio.run(main(metrics_port=METRICS_PORT))
@@ -0,0 +1,73 @@
+import zlib
+
+# Compressed plaintexts start with this tag; JSON text never starts with NUL,
+# so a plain envelope can never be mistaken for a compressed one. The cleartext
+# framing.CHAT_COMPRESSED flag tells the server the same thing.
+COMPRESSED_TAG = b"\x00Z"
+ALGORITHM = "zlib-dict-v2"  # name offered and accepted in the handshake; names ZDICT too
+
+# Payloads shorter than this go out as they are
+MIN_COMPRESS_SIZE = 48
+
+# Preset dictionary built from typical chat envelopes. zlib matches best against the
+# end of the dictionary, so the most frequent strings come last: binary (bin1)
+# envelopes, the default, after the JSON ones. Peers must share it byte for byte,
+# so any change needs a new ALGORITHM name.
+ZDICT = (
+    b" the you and that for are with this have what just not was but can "
+    b"hello thanks okay yes no lol see you later good morning night "
+    b'"}, {"username": "", "msg": "'
+    b'{"username": "'
+    b'", "msg": "'
+    # Batch of several envelopes: magic, then a u32 length before each
+    b"\x00B\x00\x00\x00"
+    # bin1 header: tag, version 1, no flags, a ms timestamp (its top bytes until 2039),
+    # a small seq, then username and message lengths
+    b"\x00E\x01\x00\x00\x00\x01"
+    b"\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+    b"\x05\x00\x00\x00"
+)
+
+
+def new_stats():
+    """Counters for bytes on the wire before and after compression"""
+    return {"frames": 0, "compressed": 0, "skipped": 0,
+            "plain_bytes": 0, "payload_bytes": 0, "wire_bytes": 0}
+
+
+def compress(plaintext: bytes, stats=None) -> bytes:
+    """Deflate plaintext against ZDICT unless it is too small or doesn't shrink"""
+    payload = plaintext
+    if len(plaintext) >= MIN_COMPRESS_SIZE:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=ZDICT)
+        candidate = COMPRESSED_TAG + compressor.compress(plaintext) + compressor.flush()
+        if len(candidate) < len(plaintext):
+            payload = candidate
+
+    if stats is not None:
+        count(stats, plaintext, payload)
+    return payload
+
+
+def count(stats, plaintext, payload):
+    """Add one frame to stats; payload is plaintext itself when it went out uncompressed"""
+    stats["frames"] += 1
+    stats["compressed" if payload is not plaintext else "skipped"] += 1
+    stats["plain_bytes"] += len(plaintext)
+    stats["payload_bytes"] += len(payload)
+
+
+def summary(stats):
+    """One line on bytes before and after compression, for logs"""
+    saved = 1 - stats["payload_bytes"] / stats["plain_bytes"] if stats["plain_bytes"] else 0
+    return (f"{stats['frames']} frames ({stats['compressed']} compressed): {stats['plain_bytes']} bytes "
+            f"before compression, {stats['payload_bytes']} after ({saved:.0%} saved), "
+            f"{stats['wire_bytes']} on the wire")
+
+
+def decompress(payload: bytes) -> bytes:
+    """Inverse of compress(); payloads without the tag are returned unchanged"""
+    if not payload.startswith(COMPRESSED_TAG):
+        return payload
+    decompressor = zlib.decompressobj(-15, zdict=ZDICT)
+    return decompressor.decompress(payload[len(COMPRESSED_TAG):]) + decompressor.flush()
@@ -2,16 +2,62 @@ import secrets
 import random
 import hashlib
 import os
-
-def is_prime(n, k=5):
-    """Miller-Rabin primality test (probabilistic)"""
-    if n <= 1:
-        return False
-    if n == 2 or n == 3:
-        return True
-    if n % 2 == 0:
-        return False
-
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+# Big-integer backend for modular exponentiation, inversion and primality tests:
+# "python" runs on CPython ints, "gmpy2" on GMP. CHAT_BIGINT selects one ("auto", the
+# default, takes gmpy2 when it is installed), or call set_backend(). Results are
+# converted back to int, so keys and ciphertexts are plain ints with either backend.
+BACKENDS = ("python", "gmpy2")
+backend = "python"
+
+def available_backends():
+    return [name for name in BACKENDS if name != "gmpy2" or gmpy2 is not None]
+
+def set_backend(name="auto"):
+    """Select the big-integer backend and return its name"""
+    global backend
+    if name == "auto":
+        name = "gmpy2" if gmpy2 is not None else "python"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown big-integer backend: {name!r} (expected one of {', '.join(BACKENDS)})")
+    if name == "gmpy2" and gmpy2 is None:
+        raise ImportError("The gmpy2 big-integer backend needs gmpy2: pip install gmpy2")
+    backend = name
+    return name
+
+def powmod(base, exponent, modulus):
+    """base^exponent mod modulus on the selected backend"""
+    if backend == "gmpy2":
+        return int(gmpy2.powmod(base, exponent, modulus))
+    return pow(base, exponent, modulus)
+
+set_backend(os.environ.get("CHAT_BIGINT", "auto"))
+
+# Odd primes below SIEVE_LIMIT, used for trial division and the candidate sieve
+SIEVE_LIMIT = 4096
+SIEVE_WINDOW = 4096  # odd candidates examined per sieve window
+
+def _small_primes(limit):
+    """Sieve of Eratosthenes for the odd primes below limit"""
+    flags = bytearray([1]) * limit
+    flags[0:2] = b'\x00\x00'
+    for i in range(2, int(limit ** 0.5) + 1):
+        if flags[i]:
+            flags[i * i::i] = bytes(len(range(i * i, limit, i)))
+    return [i for i in range(3, limit) if flags[i]]
+
+SMALL_PRIMES = _small_primes(SIEVE_LIMIT)
+
+def _miller_rabin(n, k):
+    """Miller-Rabin witness loop for an odd n > 3"""
     # Write n-1 as d*2^r
     r, d = 0, n - 1
     while d % 2 == 0:
@@ -32,13 +78,124 @@ def is_prime(n, k=5):
             return False
     return True
 
-def generate_prime(bit_length):
-    """Generate large prime number"""
+def is_prime(n, k=5):
+    """Miller-Rabin primality test (probabilistic)"""
+    if n <= 1:
+        return False
+    if n == 2 or n == 3:
+        return True
+    if n % 2 == 0:
+        return False
+    if backend == "gmpy2":
+        return gmpy2.is_prime(n, k)  # GMP does its own trial division
+
+    # Cheap trial division before paying for modular exponentiations
+    for p in SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+
+    return _miller_rabin(n, k)
+
+def _probably_prime(n, k):
+    """Primality test for a candidate that already passed trial division"""
+    if backend == "gmpy2":
+        return gmpy2.is_prime(n, k)
+    return _miller_rabin(n, k)
+
+def _sieve_window(start, size):
+    """Flag which of start, start+2, ..., start+2*(size-1) survive trial division"""
+    survivors = bytearray([1]) * size
+    for p in SMALL_PRIMES:
+        # start + 2*j ≡ 0 (mod p)  <=>  j ≡ -start * 2^-1 (mod p)
+        j = (-start * ((p + 1) // 2)) % p
+        if j < size:
+            survivors[j::p] = bytes(len(range(j, size, p)))
+    return survivors
+
+def generate_prime(bit_length, stats=None, cancel=None):
+    """Generate large prime number
+
+    Walks forward from a random odd start through a sieve of small primes and
+    only runs Miller-Rabin on the survivors. If a dict is passed as stats, the
+    counts of candidates, sieve rejections and Miller-Rabin rejections are added to it.
+    If cancel (an Event) gets set the search gives up and returns None.
+    """
+    if stats is None:
+        stats = {}
+    for key in ("candidates", "sieve_rejected", "mr_rejected"):
+        stats.setdefault(key, 0)
+
+    # Tiny primes would be sieved out by their own table entry
+    if bit_length <= SIEVE_LIMIT.bit_length():
+        while True:
+            num = secrets.randbits(bit_length)
+            num |= (1 << bit_length - 1) | 1  # Ensure high bit set and odd
+            stats["candidates"] += 1
+            if is_prime(num):
+                return num
+            stats["mr_rejected"] += 1
+
+    upper = 1 << bit_length
     while True:
-        num = secrets.randbits(bit_length)
-        num |= (1 << bit_length - 1) | 1  # Ensure high bit set and odd
-        if is_prime(num):
-            return num
+        start = secrets.randbits(bit_length)
+        start |= (1 << bit_length - 1) | 1  # Ensure high bit set and odd
+
+        # Incremental search: slide the window forward until it leaves the bit range
+        while start < upper:
+            survivors = _sieve_window(start, SIEVE_WINDOW)
+            for j in range(SIEVE_WINDOW):
+                num = start + 2 * j
+                if num >= upper:
+                    break
+                stats["candidates"] += 1
+                if not survivors[j]:
+                    stats["sieve_rejected"] += 1
+                    continue
+                if cancel is not None and cancel.is_set():
+                    return None
+                if _probably_prime(num, 5):
+                    return num
+                stats["mr_rejected"] += 1
+            start += 2 * SIEVE_WINDOW
+
+# Set in each pool process so running searches can be cancelled
+_worker_cancel = None
+
+def _init_prime_worker(cancel, backend_name):
+    global _worker_cancel
+    _worker_cancel = cancel
+    set_backend(backend_name)  # set_backend() calls don't reach spawned workers
+
+def _prime_worker(bit_length):
+    return generate_prime(bit_length, cancel=_worker_cancel)
+
+def generate_primes_parallel(bit_length, count=2, workers=None):
+    """Search for count distinct primes on a process pool
+
+    Every worker searches independently; the first count distinct hits win and
+    the remaining searches are cancelled.
+    """
+    workers = workers or os.cpu_count() or 1
+    cancel = multiprocessing.Event()
+    pool = ProcessPoolExecutor(max_workers=workers,
+                               initializer=_init_prime_worker,
+                               initargs=(cancel, backend))
+    primes = []
+    try:
+        pending = {pool.submit(_prime_worker, bit_length) for _ in range(workers)}
+        while len(primes) < count:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                prime = future.result()
+                if prime not in primes and len(primes) < count:
+                    primes.append(prime)
+                # Keep the pool busy until we have enough distinct primes
+                if len(primes) < count:
+                    pending.add(pool.submit(_prime_worker, bit_length))
+    finally:
+        cancel.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+    return primes
 
 def gcd(a, b):
     """Euclidean algorithm for GCD"""
@@ -48,6 +205,12 @@ def gcd(a, b):
 
 def mod_inverse(e, phi):
     """Extended Euclidean algorithm for modular inverse"""
+    if backend == "gmpy2":
+        try:
+            return int(gmpy2.invert(e, phi))
+        except ZeroDivisionError:
+            return None  # Inverse doesn't exist
+
     # d*e ≡ 1 mod phi
     old_r, r = e, phi
     old_s, s = 1, 0
@@ -63,13 +226,51 @@ def mod_inverse(e, phi):
         return None  # Inverse doesn't exist
     return old_s % phi
 
-def generate_keys(bit_length=1024, _p=None, _q=None):
-    """Generate RSA public and private keys"""
+class PrivateKey:
+    """RSA private key keeping the CRT parameters (p, q, dP, dQ, qInv)"""
+    def __init__(self, d, n, p, q):
+        self.d = d
+        self.n = n
+        self.p = p
+        self.q = q
+        self.dP = d % (p - 1)
+        self.dQ = d % (q - 1)
+        self.qInv = mod_inverse(q, p)
+
+    def __iter__(self):
+        # Keeps legacy unpacking working: d, n = private_key
+        return iter((self.d, self.n))
+
+    def __repr__(self):
+        return f"PrivateKey(d={self.d}, n={self.n})"
+
+def rsa_private(c, private_key):
+    """Raw RSA private-key operation m ≡ c^d mod n (CRT when available)"""
+    if isinstance(private_key, PrivateKey):
+        # Garner's recombination: two half-size exponentiations instead of one full-size
+        m1 = powmod(c, private_key.dP, private_key.p)
+        m2 = powmod(c, private_key.dQ, private_key.q)
+        h = (private_key.qInv * (m1 - m2)) % private_key.p
+        return m2 + h * private_key.q
+
+    # Legacy (d, n) tuple
+    d, n = private_key
+    return powmod(c, d, n)
+
+def generate_keys(bit_length=1024, _p=None, _q=None, parallel=False, workers=None):
+    """Generate RSA public and private keys
+
+    With parallel=True the two primes are searched for on a process pool of
+    workers processes (defaults to the CPU count).
+    """
     # Step 1: Generate two large primes
-    p = generate_prime(bit_length // 2)
-    q = generate_prime(bit_length // 2)
-    while p == q:
+    if parallel:
+        p, q = generate_primes_parallel(bit_length // 2, 2, workers)
+    else:
+        p = generate_prime(bit_length // 2)
         q = generate_prime(bit_length // 2)
+        while p == q:
+            q = generate_prime(bit_length // 2)
 
     if _p != None and _q != None:
         p = _p
@@ -89,30 +290,40 @@ def generate_keys(bit_length=1024, _p=None, _q=None):
     # Step 5: Compute private exponent d
     d = mod_inverse(e, phi)
 
-    return (e, n), (d, n)  # Public key, Private key
+    return (e, n), PrivateKey(d, n, p, q)  # Public key, Private key
+
+HASH_LEN = hashlib.sha256().digest_size
 
 def mgf1(seed: bytes, length: int):
     """Mask Generation Function 1 based on SHA-256"""
-    counter = 0
-    output = b""
-    #looping to get desired random length output
-    while len(output) < length:
-        C = counter.to_bytes(4, byteorder='big')
-        output += hashlib.sha256(seed + C).digest()
-        counter += 1
+    # Hash the seed once and only feed the counter into copies of that context
+    base = hashlib.sha256(seed)
+    blocks = []
+    for counter in range((length + HASH_LEN - 1) // HASH_LEN):
+        h = base.copy()
+        h.update(counter.to_bytes(4, byteorder='big'))
+        blocks.append(h.digest())
     #This return format handles cases where the last hash append made the output longer than needed
-    return output[:length]
+    return b"".join(blocks)[:length]
+
+def _xor(a: bytes, b: bytes) -> bytes:
+    """XOR two equal-length byte strings as whole integers"""
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(len(a), 'big')
+
+@lru_cache(maxsize=32)
+def _label_hash(label: bytes) -> bytes:
+    return hashlib.sha256(label).digest()
 
 def oaep_encode(message: bytes, k: int, label: bytes = b'') -> bytes:
     """OAEP encoding with SHA-256"""
-    hLen = hashlib.sha256().digest_size
+    hLen = HASH_LEN
     mLen = len(message)
 
     if mLen > k - 2 * hLen - 2:
         raise ValueError("Message too long")
 
     # Hash the label
-    lHash = hashlib.sha256(label).digest()
+    lHash = _label_hash(label)
 
     # Generate padding string (PS)
     ps_len = k - mLen - 2 * hLen - 2
@@ -128,13 +339,13 @@ def oaep_encode(message: bytes, k: int, label: bytes = b'') -> bytes:
     dbMask = mgf1(seed, k - hLen - 1)
 
     # Step 6: maskedDB = DB ⊕ dbMask
-    maskedDB = bytes(x ^ y for x, y in zip(DB, dbMask))
+    maskedDB = _xor(DB, dbMask)
 
     # Step 7: seedMask = MGF1(maskedDB, hLen)
     seedMask = mgf1(maskedDB, hLen)
 
     # Step 8: maskedSeed = seed ⊕ seedMask
-    maskedSeed = bytes(x ^ y for x, y in zip(seed, seedMask))
+    maskedSeed = _xor(seed, seedMask)
 
     # Step 9: Final encoded message EM = 0x00 || maskedSeed || maskedDB
     EncodedMessage = b'\x00' + maskedSeed + maskedDB
@@ -143,7 +354,7 @@ def oaep_encode(message: bytes, k: int, label: bytes = b'') -> bytes:
 
 def oaep_decode(encoded: bytes, k: int, label: bytes = b'') -> bytes:
     """OAEP decoding with SHA-256"""
-    hLen = hashlib.sha256().digest_size
+    hLen = HASH_LEN
 
     if len(encoded) != k:
         raise ValueError("Decryption error: encoded length mismatch")
@@ -163,34 +374,30 @@ def oaep_decode(encoded: bytes, k: int, label: bytes = b'') -> bytes:
     seedMask = mgf1(maskedDB, hLen)
 
     # Step 2: seed = maskedSeed ⊕ seedMask
-    seed = bytes(x ^ y for x, y in zip(maskedSeed, seedMask))
+    seed = _xor(maskedSeed, seedMask)
 
     # Step 3: dbMask = MGF1(seed, k - hLen - 1)
     dbMask = mgf1(seed, k - hLen - 1)
 
     # Step 4: DB = maskedDB ⊕ dbMask
-    DB = bytes(x ^ y for x, y in zip(maskedDB, dbMask))
+    DB = _xor(maskedDB, dbMask)
 
     # Step 5: Separate DB into lHash', PS, 0x01, M
-    lHash = hashlib.sha256(label).digest()
+    lHash = _label_hash(label)
     lHash_prime = DB[:hLen]
 
     if lHash != lHash_prime:
         raise ValueError("Decryption error: label hash mismatch")
 
-    # Step 6: Find the position of the 0x01 byte separating PS and M
-    i = hLen
-    while i < len(DB):
-        if DB[i] == 0x01:
-            break
-        elif DB[i] != 0x00:
-            raise ValueError("Decryption error: invalid padding")
-        i += 1
-    else:
+    # Step 6: Skip the zero padding PS; the first non-zero byte must be the 0x01 separator
+    rest = DB[hLen:].lstrip(b'\x00')
+    if not rest:
         raise ValueError("Decryption error: 0x01 not found")
+    if rest[0] != 0x01:
+        raise ValueError("Decryption error: invalid padding")
 
     # Step 7: Return the message after 0x01
-    return DB[i + 1:]
+    return rest[1:]
 
 def encrypt_oaep(message_bytes: bytes, public_key, label: bytes = b''):
     """Encrypt message using RSA-OAEP"""
@@ -205,19 +412,46 @@ def encrypt_oaep(message_bytes: bytes, public_key, label: bytes = b''):
     # Convert padded message to integer
     m_int = int.from_bytes(padded, 'big')
     # RSA encryption: c ≡ m^e mod n
-    c = pow(m_int, e, n)
+    c = powmod(m_int, e, n)
 
     return c
 
+def _encrypt_oaep_chunk(message_bytes: bytes, public_keys, label: bytes):
+    ciphertexts = []
+    for public_key in public_keys:
+        try:
+            ciphertexts.append(encrypt_oaep(message_bytes, public_key, label))
+        except (ValueError, TypeError) as e:
+            ciphertexts.append(e)  # a bad key fails its own slot, not the batch
+    return ciphertexts
+
+def encrypt_oaep_batch(message_bytes: bytes, public_keys, label: bytes = b'', executor=None, chunk_size=32):
+    """Encrypt one message to many public keys using RSA-OAEP
+
+    Returns the ciphertexts in the order of public_keys; a key that cannot be
+    used gets the exception it raised in its slot instead. If an executor
+    (thread or process pool) is given, the keys are split into chunks of
+    chunk_size and encrypted on it; otherwise they are encrypted in-line.
+    """
+    public_keys = list(public_keys)
+    _label_hash(label)  # warm the cache once for the whole batch
+
+    if executor is None or len(public_keys) <= chunk_size:
+        return _encrypt_oaep_chunk(message_bytes, public_keys, label)
+
+    chunks = [public_keys[i:i + chunk_size] for i in range(0, len(public_keys), chunk_size)]
+    futures = [executor.submit(_encrypt_oaep_chunk, message_bytes, chunk, label) for chunk in chunks]
+    return [c for future in futures for c in future.result()]
+
 def decrypt_oaep(ciphertext, private_key, label: bytes = b''):
     """Decrypt ciphertext using RSA-OAEP"""
-    d, n = private_key
+    _, n = private_key
     
     # Calculate key size in bytes
     k = (n.bit_length() + 7) // 8
     
     # RSA decryption: m ≡ c^d mod n
-    m_int = pow(ciphertext, d, n)
+    m_int = rsa_private(ciphertext, private_key)
     
     # Convert integer back to bytes with proper padding
     padded = m_int.to_bytes(k, 'big')
@@ -240,14 +474,13 @@ def encrypt(message, public_key):
         raise ValueError("Message too long for key size")
 
     # Encrypt: c ≡ m^e mod n
-    c = pow(m_int, e, n)
+    c = powmod(m_int, e, n)
     return c
 
 def decrypt(ciphertext, private_key):
     """Decrypt ciphertext using basic RSA (without OAEP)"""
-    d, n = private_key
     # Decrypt: m ≡ c^d mod n
-    m_int = pow(ciphertext, d, n)
+    m_int = rsa_private(ciphertext, private_key)
 
     # Convert integer back to string
     byte_length = (m_int.bit_length() + 7) // 8
@@ -0,0 +1,56 @@
+import json
+import struct
+import time
+
+# Binary chat envelope, the plaintext that gets compressed and AES-encrypted:
+#   tag | version (u8) | flags (u8) | timestamp ms (u64) | seq (u64)
+#       | username length (u16) | message length (u32) | username | message
+# Old peers send {"username": ..., "msg": ...} JSON, which never starts with NUL,
+# so decode() tells the two apart by the tag.
+ENVELOPE_TAG = b"\x00E"
+VERSION = 1
+FORMAT = "bin1"  # name offered and accepted in the handshake
+
+HEADER = struct.Struct("!2sBBQQHI")
+
+FLAG_EDITED = 0x01
+FLAG_SYSTEM = 0x02
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def encode(username: str, msg: str, timestamp=None, seq=0, flags=0) -> bytes:
+    name = username.encode()
+    text = msg.encode()
+    if timestamp is None:
+        timestamp = now_ms()
+    return HEADER.pack(ENVELOPE_TAG, VERSION, flags, timestamp, seq, len(name), len(text)) + name + text
+
+
+def encode_json(username: str, msg: str) -> bytes:
+    """The envelope old peers understand"""
+    return json.dumps({"username": username, "msg": msg}).encode()
+
+
+def decode(data: bytes):
+    """Envelope dict (username, msg, timestamp, seq, flags) from either encoding"""
+    if not data.startswith(ENVELOPE_TAG):
+        obj = json.loads(data)
+        return {"username": obj["username"], "msg": obj["msg"], "timestamp": None, "seq": 0, "flags": 0}
+
+    _, version, flags, timestamp, seq, name_len, text_len = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported envelope version: {version}")
+    start = HEADER.size
+    end = start + name_len + text_len
+    if end > len(data):
+        raise ValueError("Truncated envelope")
+    return {
+        "username": bytes(data[start:start + name_len]).decode(),
+        "msg": bytes(data[start + name_len:end]).decode(),
+        "timestamp": timestamp,
+        "seq": seq,
+        "flags": flags,
+    }
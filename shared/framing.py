@@ -0,0 +1,112 @@
+import json
+import struct
+
+# Server -> client binary frames for clients that asked for sequence numbers.
+#   message: kind (0x01) | seq (u64) | data
+#   replay:  kind (0x02) | count (u32) | count * (seq (u64) | length (u32) | data)
+#   control: kind (0x03) | JSON options, from the server itself (e.g. the room's formats)
+FRAME_MESSAGE = 0x01
+FRAME_REPLAY = 0x02
+FRAME_CONTROL = 0x03
+
+MESSAGE_HEADER = struct.Struct("!BQ")
+REPLAY_HEADER = struct.Struct("!BI")
+REPLAY_ENTRY = struct.Struct("!QI")
+
+# Keep replay frames well under the websockets default 1 MiB max_size
+MAX_REPLAY_FRAME = 512 * 1024
+
+
+def pack_message(seq, data: bytes) -> bytes:
+    return MESSAGE_HEADER.pack(FRAME_MESSAGE, seq) + data
+
+
+def pack_replay(entries):
+    """Pack (seq, data) entries into as few replay frames as fit MAX_REPLAY_FRAME"""
+    frames = []
+    parts = []
+    size = REPLAY_HEADER.size
+    for seq, data in entries:
+        entry_size = REPLAY_ENTRY.size + len(data)
+        if parts and size + entry_size > MAX_REPLAY_FRAME:
+            frames.append(REPLAY_HEADER.pack(FRAME_REPLAY, len(parts) // 2) + b"".join(parts))
+            parts = []
+            size = REPLAY_HEADER.size
+        parts.append(REPLAY_ENTRY.pack(seq, len(data)))
+        parts.append(data)
+        size += entry_size
+    if parts:
+        frames.append(REPLAY_HEADER.pack(FRAME_REPLAY, len(parts) // 2) + b"".join(parts))
+    return frames
+
+
+def pack_control(options) -> bytes:
+    return bytes([FRAME_CONTROL]) + json.dumps(options, separators=(",", ":")).encode()
+
+
+def is_control(frame) -> bool:
+    return isinstance(frame, bytes) and frame[:1] == bytes([FRAME_CONTROL])
+
+
+def unpack_control(frame: bytes):
+    return json.loads(frame[1:])
+
+
+def unpack(frame: bytes):
+    """Split a sequenced frame into its (seq, data) entries"""
+    kind = frame[0]
+    if kind == FRAME_MESSAGE:
+        _, seq = MESSAGE_HEADER.unpack_from(frame)
+        return [(seq, frame[MESSAGE_HEADER.size:])]
+    if kind == FRAME_REPLAY:
+        _, count = REPLAY_HEADER.unpack_from(frame)
+        entries = []
+        offset = REPLAY_HEADER.size
+        for _ in range(count):
+            seq, length = REPLAY_ENTRY.unpack_from(frame, offset)
+            offset += REPLAY_ENTRY.size
+            entries.append((seq, frame[offset:offset + length]))
+            offset += length
+        return entries
+    raise ValueError(f"Unknown frame kind: {kind}")
+
+
+# Client -> server chat frames from clients that take updates:
+#   chat: flags (u8) | IV | AES-CBC ciphertext
+# The flags name the payload formats sealed inside, so the server can keep the frame
+# from members that can't read them. The server strips the byte before relaying, and
+# gives the frames of older clients, which have no such byte, a zero one.
+CHAT_COMPRESSED = 0x01
+CHAT_BINARY_ENVELOPE = 0x02
+CHAT_BATCH = 0x04
+CHAT_FLAGS = CHAT_COMPRESSED | CHAT_BINARY_ENVELOPE | CHAT_BATCH
+
+
+def pack_chat(flags, sealed: bytes) -> bytes:
+    return bytes([flags]) + sealed
+
+
+# Attachment frames, sent by clients and relayed like any other frame:
+#   magic | transfer id (16 bytes) | kind (u8) | chunk index (u32) | payload
+# Receivers drop frames that carry the magic but belong to no transfer they are
+# receiving; a relayed chat frame starts with a random IV, so it carries the magic
+# only once in 2**32 frames.
+ATTACHMENT_MAGIC = b"\xffATT"
+ATTACHMENT_HEADER = struct.Struct("!4s16sBI")
+ATTACHMENT_START = 0
+ATTACHMENT_DATA = 1
+ATTACHMENT_END = 2
+
+
+def is_attachment(frame) -> bool:
+    return len(frame) >= ATTACHMENT_HEADER.size and frame[:4] == ATTACHMENT_MAGIC
+
+
+def pack_attachment(transfer_id: bytes, kind, index, payload: bytes) -> bytes:
+    return ATTACHMENT_HEADER.pack(ATTACHMENT_MAGIC, transfer_id, kind, index) + payload
+
+
+def unpack_attachment(frame):
+    """(transfer id, kind, chunk index, payload) of an attachment frame"""
+    _, transfer_id, kind, index = ATTACHMENT_HEADER.unpack_from(frame)
+    return transfer_id, kind, index, frame[ATTACHMENT_HEADER.size:]
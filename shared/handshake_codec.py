@@ -0,0 +1,70 @@
+import json
+import struct
+
+# Binary handshake, sent as websocket binary messages (the legacy handshake is JSON text):
+#   hello: magic | version (u8) | e length (u16) | n length (u16) | options length (u16)
+#          | e | n | options
+#   reply: magic | version (u8) | ciphertext length (u16) | options length (u16)
+#          | ciphertext | options
+# Integers are unsigned big-endian; the wrapped session key is padded to the modulus
+# length. Options are the small JSON dict of handshake settings (room, seq, since,
+# updates and the offered or granted compression, envelope, batch and attachment
+# formats). The client sends the highest version it speaks and the server answers
+# with the version it picked; later versions keep this header and may only add options.
+MAGIC = b"\x00RH"
+VERSION = 1
+
+HELLO_HEADER = struct.Struct("!3sBHHH")
+REPLY_HEADER = struct.Struct("!3sBHH")
+
+
+def int_to_bytes(value, length=None):
+    if length is None:
+        length = max((value.bit_length() + 7) // 8, 1)
+    return value.to_bytes(length, "big")
+
+
+def _options(raw):
+    return json.loads(raw) if raw else {}
+
+
+def _check(frame, header):
+    if len(frame) < header.size or frame[:3] != MAGIC:
+        raise ValueError("Not a binary handshake message")
+
+
+def pack_hello(public_key, options, version=VERSION) -> bytes:
+    e, n = public_key
+    e_bytes = int_to_bytes(e)
+    n_bytes = int_to_bytes(n)
+    opts = json.dumps(options, separators=(",", ":")).encode()
+    return HELLO_HEADER.pack(MAGIC, version, len(e_bytes), len(n_bytes), len(opts)) + e_bytes + n_bytes + opts
+
+
+def unpack_hello(frame: bytes):
+    """(version, (e, n), options) of a hello"""
+    _check(frame, HELLO_HEADER)
+    _, version, e_len, n_len, opts_len = HELLO_HEADER.unpack_from(frame)
+    offset = HELLO_HEADER.size
+    e = int.from_bytes(frame[offset:offset + e_len], "big")
+    offset += e_len
+    n = int.from_bytes(frame[offset:offset + n_len], "big")
+    offset += n_len
+    return version, (e, n), _options(frame[offset:offset + opts_len])
+
+
+def pack_reply(ciphertext, modulus, options, version=VERSION) -> bytes:
+    """Reply carrying the OAEP-wrapped session key as a fixed-width modulus-sized field"""
+    c_bytes = int_to_bytes(ciphertext, (modulus.bit_length() + 7) // 8)
+    opts = json.dumps(options, separators=(",", ":")).encode()
+    return REPLY_HEADER.pack(MAGIC, version, len(c_bytes), len(opts)) + c_bytes + opts
+
+
+def unpack_reply(frame: bytes):
+    """(version, ciphertext, options) of a reply"""
+    _check(frame, REPLY_HEADER)
+    _, version, c_len, opts_len = REPLY_HEADER.unpack_from(frame)
+    offset = REPLY_HEADER.size
+    ciphertext = int.from_bytes(frame[offset:offset + c_len], "big")
+    offset += c_len
+    return version, ciphertext, _options(frame[offset:offset + opts_len])
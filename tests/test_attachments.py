@@ -0,0 +1,113 @@
+import sys
+import os
+import pytest
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "client")))
+
+from shared import framing
+from attachments import CHUNK_SIZE, AttachmentReceiver, outgoing_frames
+from websocekt_client import WebSocketClient, aes_cbc_decrypt, aes_cbc_encrypt
+
+KEY = bytes(range(16))
+
+
+def seal(plaintext):
+    iv = os.urandom(16)
+    return iv + aes_cbc_encrypt(plaintext, KEY, iv)
+
+
+def unseal(data):
+    return aes_cbc_decrypt(data[16:], KEY, data[:16])
+
+
+@pytest.fixture
+def sent_file(tmp_path):
+    path = tmp_path / "report.bin"
+    path.write_bytes(os.urandom(2 * CHUNK_SIZE + 100))
+    return path
+
+
+@pytest.fixture
+def frames(sent_file):
+    return [frame for frame, _, _ in outgoing_frames(str(sent_file), "ahmed", KEY, seal)]
+
+
+@pytest.fixture
+def receiver(tmp_path):
+    return AttachmentReceiver(str(tmp_path / "downloads"))
+
+
+@pytest.fixture
+def client(receiver):
+    client = WebSocketClient("ws://127.0.0.1:1", 1024)
+    client.aes_key = KEY
+    client.attachments = receiver
+    client.errors = []
+    client.error.connect(client.errors.append)
+    return client
+
+
+def with_index(frame, index):
+    transfer_id, kind, _, payload = framing.unpack_attachment(frame)
+    return framing.pack_attachment(transfer_id, kind, index, payload)
+
+
+def test_transfer_round_trip(receiver, frames, sent_file):
+    events = [receiver.handle(frame, KEY, unseal) for frame in frames]
+    event, transfer = events[-1]
+    assert event == "done"
+    with open(transfer.path, "rb") as f:
+        assert f.read() == sent_file.read_bytes()
+
+
+def test_chunk_past_the_announced_size_is_rejected(receiver, frames):
+    receiver.handle(frames[0], KEY, unseal)
+    with pytest.raises(ValueError):
+        receiver.handle(with_index(frames[1], 2 ** 32 - 1), KEY, unseal)
+    assert not receiver.transfers
+    assert not os.listdir(receiver.directory)  # the .part file is gone
+
+
+def test_oversized_chunk_is_rejected(receiver, frames):
+    receiver.handle(frames[0], KEY, unseal)
+    with pytest.raises(ValueError):
+        # The last chunk is 100 bytes; a full one at its index runs past the end
+        receiver.handle(with_index(frames[1], 2), KEY, unseal)
+
+
+def test_rest_of_an_aborted_transfer_is_ignored(receiver, frames):
+    receiver.handle(frames[0], KEY, unseal)
+    with pytest.raises(ValueError):
+        receiver.handle(with_index(frames[1], 2 ** 32 - 1), KEY, unseal)
+    assert [receiver.handle(frame, KEY, unseal) for frame in frames[1:]] == [None] * (len(frames) - 1)
+    assert not receiver.aborted  # forgotten once its END went by
+
+
+def test_chunks_of_an_unusable_start_are_ignored(receiver, frames):
+    transfer_id, kind, index, _ = framing.unpack_attachment(frames[0])
+    assert receiver.handle(framing.pack_attachment(transfer_id, kind, index, seal(b"not json")), KEY, unseal) is None
+    assert receiver.handle(frames[1], KEY, unseal) is None
+    assert not receiver.transfers
+
+
+def test_client_drops_chunks_without_a_start(client, frames):
+    # e.g. joined mid-transfer: the chunk must not be decrypted as chat
+    assert client._decode_frame(framing.pack_message(1, frames[1])) == []
+    assert client.errors == []
+
+
+def test_client_drops_chunks_of_an_aborted_transfer(client, frames):
+    client._decode_frame(framing.pack_message(1, frames[0]))
+    client._decode_frame(framing.pack_message(2, with_index(frames[1], 2 ** 32 - 1)))
+    assert len(client.errors) == 1
+    replay = framing.pack_replay([(3 + i, frame) for i, frame in enumerate(frames[1:])])
+    assert client._decode_frame(replay[0]) == []
+    assert len(client.errors) == 1
+
+
+def test_client_reports_undecryptable_frames_and_keeps_going(client):
+    chat = seal(b'{"username": "ahmed", "msg": "hi"}')
+    received = client._decode_frame(framing.pack_replay([(1, os.urandom(33)), (2, chat)])[0])
+    assert [message["msg"] for message in received] == ["hi"]
+    assert len(client.errors) == 1
+    assert client.last_seq == 2
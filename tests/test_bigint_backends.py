@@ -0,0 +1,107 @@
+import sys
+import os
+import random
+import pytest
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from shared import encryption
+
+# Every check runs against each installed big-integer backend of shared/encryption.py
+
+BACKENDS = encryption.available_backends()
+
+PRIMES = [2, 3, 5, 4093, 4099, 65537, 2 ** 61 - 1, 2 ** 89 - 1, 2 ** 127 - 1]
+COMPOSITES = [-7, 0, 1, 4, 4095, 561, 41041, 825265,  # Carmichael numbers
+              3215031751,  # strong pseudoprime to bases 2, 3, 5 and 7
+              (2 ** 61 - 1) * (2 ** 89 - 1), 2 ** 127 + 1]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    previous = encryption.backend
+    encryption.set_backend(request.param)
+    yield request.param
+    encryption.set_backend(previous)
+
+
+@pytest.fixture(scope="module")
+def keys():
+    """One key pair per size, made with the pure-Python backend"""
+    previous = encryption.backend
+    encryption.set_backend("python")
+    try:
+        return {bits: encryption.generate_keys(bits) for bits in (1024, 2048)}
+    finally:
+        encryption.set_backend(previous)
+
+
+@pytest.mark.parametrize("n", PRIMES)
+def test_is_prime_accepts_primes(backend, n):
+    assert encryption.is_prime(n)
+
+
+@pytest.mark.parametrize("n", COMPOSITES)
+def test_is_prime_rejects_composites(backend, n):
+    assert not encryption.is_prime(n)
+
+
+def test_powmod_matches_pow(backend):
+    rng = random.Random(0)
+    for _ in range(200):
+        modulus = rng.getrandbits(512) | 1
+        base, exponent = rng.getrandbits(600), rng.getrandbits(512)
+        result = encryption.powmod(base, exponent, modulus)
+        assert result == pow(base, exponent, modulus)
+        assert type(result) is int
+
+
+def test_mod_inverse_matches_pow(backend):
+    rng = random.Random(1)
+    for _ in range(200):
+        modulus = rng.getrandbits(512) | 1
+        a = rng.getrandbits(256) | 1
+        expected = pow(a, -1, modulus) if encryption.gcd(a, modulus) == 1 else None
+        assert encryption.mod_inverse(a, modulus) == expected
+    assert encryption.mod_inverse(6, 9) is None
+
+
+def test_generate_prime(backend):
+    prime = encryption.generate_prime(512)
+    assert prime.bit_length() == 512
+    assert encryption._miller_rabin(prime, 20)
+
+
+@pytest.mark.parametrize("bits", [1024, 2048])
+def test_generate_keys(backend, bits):
+    public_key, private_key = encryption.generate_keys(bits)
+    e, n = public_key
+    p, q = private_key.p, private_key.q
+    assert n.bit_length() in (bits - 1, bits)  # only the top bit of p and q is fixed
+    assert p * q == n
+    assert e * private_key.d % ((p - 1) * (q - 1)) == 1
+    assert all(type(value) is int for value in (e, n, private_key.d, private_key.qInv))
+
+
+@pytest.mark.parametrize("bits", [1024, 2048])
+def test_round_trips(backend, keys, bits):
+    public_key, private_key = keys[bits]
+    message = os.urandom(16)
+    ciphertext = encryption.encrypt_oaep(message, public_key)
+    assert encryption.decrypt_oaep(ciphertext, private_key) == message
+    assert encryption.decrypt_oaep(ciphertext, (private_key.d, private_key.n)) == message
+    assert encryption.decrypt(encryption.encrypt("hello", public_key), private_key) == "hello"
+
+
+@pytest.mark.parametrize("encrypt_with", BACKENDS)
+def test_ciphertexts_decrypt_under_every_backend(backend, keys, encrypt_with):
+    public_key, private_key = keys[1024]
+    message = os.urandom(16)
+    encryption.set_backend(encrypt_with)
+    ciphertext = encryption.encrypt_oaep(message, public_key)
+    encryption.set_backend(backend)
+    assert encryption.decrypt_oaep(ciphertext, private_key) == message
+
+
+def test_set_backend_rejects_unknown_names():
+    with pytest.raises(ValueError):
+        encryption.set_backend("nope")
@@ -0,0 +1,40 @@
+import sys
+import os
+import pytest
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "client")))
+
+from message_store import MessageStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MessageStore(str(tmp_path))
+    store.record("general", [("ahmed", "Meeting moved to Thursday afternoon", 1_700_000_000_000, False),
+                             ("fawzy", "thanks, see you thursday", 1_700_000_060_000, True),
+                             ("ahmed", "the quarterly report is attached", 1_700_000_120_000, False)],
+                 last_seq=3)
+    yield store
+    store.close()
+
+
+def test_search_matches_every_word(store):
+    assert [m.msg for m in store.search("general", "THURSDAY")] == ["thanks, see you thursday",
+                                                                    "Meeting moved to Thursday afternoon"]
+    assert [m.msg for m in store.search("general", "ahmed thursday")] == ["Meeting moved to Thursday afternoon"]
+    assert store.search("general", "thurs") == []
+    assert store.search("other", "thursday") == []
+
+
+def test_words_are_not_stored_in_the_clear(store, tmp_path):
+    store.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    raw = b"".join(open(tmp_path / name, "rb").read() for name in os.listdir(tmp_path)
+                   if name.startswith("history.db"))
+    for word in (b"quarterly", b"Thursday", b"thursday", b"ahmed"):
+        assert word not in raw
+
+
+def test_page_and_last_seq(store):
+    assert [m.username for m in store.page("general")] == ["ahmed", "fawzy", "ahmed"]
+    assert store.last_seq("general") == 3
+    store.set_epoch("general", "abc")
+    assert (store.last_seq("general"), store.epoch("general")) == (0, "abc")